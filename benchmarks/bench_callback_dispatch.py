@@ -0,0 +1,153 @@
+"""Маршрутизация нажатий: цепочка фильтров F.data.startswith(...) против
+таблицы префиксов CallbackRouter.
+
+Обработчики пустые: они только разбирают callback_data, как это делали
+настоящие обработчики, поэтому измеряется сама доставка апдейта до
+обработчика через Dispatcher.feed_update, без сети и базы.
+
+Запуск из корня репозитория: python benchmarks/bench_callback_dispatch.py
+"""
+
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from callbacks import (
+    CallbackRouter,
+    ChangeCallback,
+    DateCallback,
+    HomeworkPageCallback,
+    ReportCallback,
+    SolutionPageCallback,
+    SolveCallback,
+    TopCallback,
+    ViewCallback,
+    VoteCallback,
+)
+
+ROUNDS = 2000
+
+# Реальные кнопки бота, по одной каждого вида
+DATA = [
+    "change_grade",
+    "change_name",
+    "date_2099-01-01",
+    "hw_page_2099-01-01_15",
+    "report_hw_15",
+    "solve_15",
+    "view_15",
+    "sol_page_15_3_40",
+    "vote_up_40",
+    "vote_down_40",
+    "report_sol_40",
+    "top_week",
+]
+
+
+# Как было: фильтры в порядке регистрации в handlers.py, разбор строки в обработчике
+def legacy_router():
+    router = Router()
+
+    async def parse(callback: CallbackQuery):
+        return callback.data.split("_")
+
+    router.callback_query.register(parse, F.data == "change_grade")
+    router.callback_query.register(parse, F.data == "change_name")
+    router.callback_query.register(parse, F.data.startswith("date_"))
+    router.callback_query.register(parse, F.data.startswith("hw_page_"))
+    router.callback_query.register(parse, F.data.startswith("report_hw"))
+    router.callback_query.register(parse, F.data.startswith("solve_"))
+    router.callback_query.register(parse, F.data.startswith("view_"))
+    router.callback_query.register(parse, F.data.startswith("sol_page_"))
+    router.callback_query.register(parse, F.data.startswith("vote_"))
+    router.callback_query.register(parse, F.data.startswith("report_sol"))
+    router.callback_query.register(parse, F.data.in_({"top_week", "top_month"}))
+    return router
+
+
+def table_router():
+    router = Router()
+    callbacks = CallbackRouter()
+    router.callback_query.register(callbacks.dispatch)
+
+    async def parsed(callback: CallbackQuery, callback_data):
+        return callback_data
+
+    callbacks.route(ChangeCallback, kind="grade")(parsed)
+    callbacks.route(ChangeCallback, kind="name")(parsed)
+    callbacks.route(DateCallback)(parsed)
+    callbacks.route(HomeworkPageCallback)(parsed)
+    callbacks.route(ReportCallback, kind="hw")(parsed)
+    callbacks.route(SolveCallback)(parsed)
+    callbacks.route(ViewCallback)(parsed)
+    callbacks.route(SolutionPageCallback)(parsed)
+    callbacks.route(VoteCallback)(parsed)
+    callbacks.route(ReportCallback, kind="sol")(parsed)
+    callbacks.route(TopCallback)(parsed)
+    return router
+
+
+def make_updates():
+    user = User(id=1, is_bot=False, first_name="Имя")
+    message = Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=1, type="private"),
+        text="карточка",
+    )
+    return [
+        Update(
+            update_id=i,
+            callback_query=CallbackQuery(
+                id=str(i), chat_instance="1", from_user=user, message=message, data=data
+            ),
+        )
+        for i, data in enumerate(DATA)
+    ]
+
+
+async def run(router, bot, updates):
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    for update in updates:
+        result = await dp.feed_update(bot, update)
+        assert result is not None, update.callback_query.data
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for update in updates:
+            await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - start
+    return ROUNDS * len(updates) / elapsed
+
+
+async def main():
+    bot = Bot("42:BENCHMARK")
+    updates = make_updates()
+    for name, router in (("startswith", legacy_router()), ("table", table_router())):
+        rate = await run(router, bot, updates)
+        print(f"{name:10}: {rate:8.0f} callbacks/s ({1e6 / rate:5.1f} us each)")
+
+    # Только поиск маршрута и разбор строки, без машинерии Dispatcher
+    callbacks = CallbackRouter()
+    for callback_data in (SolveCallback, ViewCallback, VoteCallback, DateCallback):
+        callbacks.route(callback_data)(lambda callback: None)
+    start = time.perf_counter()
+    for _ in range(ROUNDS * 10):
+        route = callbacks.find("vote_up_40")
+        route.callback_data.unpack("vote_up_40")
+    elapsed = time.perf_counter() - start
+    print(f"find+unpack: {elapsed / (ROUNDS * 10) * 1e6:5.1f} us each")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
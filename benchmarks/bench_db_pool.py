@@ -0,0 +1,83 @@
+"""Сравнение: новое соединение на каждый запрос против пула соединений.
+
+Запуск из корня репозитория: python benchmarks/bench_db_pool.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+QUERIES = 2000
+
+
+class ConnectPerQueryDatabase(Database):
+    # Старое поведение _execute: aiosqlite.connect на каждый запрос
+    async def _execute(self, query, params=(), fetch=False, fetchone=False):
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(query, params)
+
+            if fetchone:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+            if fetch:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+
+            await db.commit()
+            return cursor
+
+
+async def prepare(path):
+    db = Database(path)
+    await db.create_tables()
+    await db.seed_subjects()
+    for user_id in range(1, 101):
+        await db.register_user(user_id, "Имя", "Фамилия", 9, "А")
+        await db.add_homework(1, 9, "А", f"Задание {user_id}", None, "2099-01-01", user_id, 0)
+    await db.close()
+
+
+# get_user отвечает из кэша пользователей, поэтому читается задание:
+# get_homework_by_id каждый раз идет в базу
+async def run(db, concurrency):
+    async def worker(count):
+        for i in range(count):
+            await db.get_homework_by_id(i % 100 + 1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(QUERIES // concurrency) for _ in range(concurrency)))
+    return QUERIES / (time.perf_counter() - start)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await prepare(path)
+
+        for concurrency in (1, 8):
+            old = ConnectPerQueryDatabase(path)
+            old_qps = await run(old, concurrency)
+
+            new = Database(path)
+            await new.connect()
+            new_qps = await run(new, concurrency)
+            await new.close()
+
+            print(
+                f"concurrency={concurrency}: connect-per-query {old_qps:8.0f} q/s, "
+                f"pool {new_qps:8.0f} q/s (x{new_qps / old_qps:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""Лента из 30 заданий: карточки по одной против конвейера
+(один запрос -> рендеринг в памяти -> отправка через Sender).
+
+Оба варианта отправляют через один и тот же Sender: "per card" делает
+свои запросы на каждую карточку и ждет ее отправки, "pipeline" читает
+ленту одним запросом и ставит все карточки в очередь окном. "page" - то,
+что теперь делает show_homework: первые HOMEWORK_PAGE_SIZE карточек и
+кнопка "Показать еще"; сообщений в нем меньше, это не та же работа.
+
+Bot заменен заглушкой с фиксированной задержкой ответа, лимиты Telegram
+в Sender подняты, чтобы сравнивать только сам конвейер.
+
+Что показывает замер: сообщения одного чата уходят строго по очереди
+(иначе Telegram перемешает карточки), поэтому время до последней из 30
+карточек в обоих вариантах около 30 * LATENCY. Конвейер убирает только
+запросы к базе между отправками - заметного сокращения времени до
+последнего сообщения на ленте из 30 карточек здесь нет. Оно появляется
+только за счет страницы из HOMEWORK_PAGE_SIZE карточек.
+
+Запуск из корня репозитория: python benchmarks/bench_feed_dispatch.py
+"""
+
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import Chat, Message
+
+from cards import card_method, render_homework
+from database import Database
+from keyboards import get_hw_actions_kb
+from sender import Sender
+
+ITEMS = 30
+STUDENTS = 30
+LATENCY = 0.02
+ROUNDS = 5
+# Как в handlers.py; сам модуль не импортируется: ему нужны переменные окружения
+HOMEWORK_PAGE_SIZE = 5
+
+
+# Запоминает, когда в каждый чат ушло первое и последнее сообщение
+class MockBot:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.delivered = {}
+
+    async def __call__(self, method):
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        now = time.perf_counter()
+        self.delivered.setdefault(method.chat_id, [now, now])[1] = now
+        return method
+
+
+def make_message(bot, chat_id):
+    message = Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+    )
+    return message.as_(bot)
+
+
+async def prepare(path):
+    db = Database(path)
+    await db.create_tables()
+    await db.seed_subjects()
+    for user_id in range(1, STUDENTS + 1):
+        await db.register_user(user_id, "Имя", "Фамилия", 9, "А")
+    for i in range(ITEMS):
+        await db.add_homework(
+            1 + i % 5, 9, "А", f"Задание {i}", None, "2099-01-01", i % STUDENTS + 1, i % 3 == 0
+        )
+        if i % 2:
+            await db.add_solution(i + 1, 1, "Решение", 0)
+    await db.close()
+
+
+# Как было: на каждую карточку свои запросы, и каждая отправка ждет ответа
+async def per_card(db, sender, message):
+    homeworks = await db.get_homework_by_class(9, "А")
+    for hw in homeworks:
+        has_sol = await db.check_solution_exists(hw["id"])
+        author_name = "Анонимно"
+        if not hw["is_anonymous"]:
+            author = await db.get_user(hw["author_id"])
+            author_name = f"{author['first_name']} {author['last_name']}"
+        display_date = datetime.datetime.strptime(hw["target_date"], "%Y-%m-%d").strftime("%d.%m")
+        text = (
+            f"📌 <b>Предмет:</b> {hw['subject_name']}\n"
+            f"📝 <b>Задание:</b> {hw['text']}\n"
+            f"⏳ <b>День:</b> {display_date}\n"
+            f"👤 <b>Автор:</b> {author_name}"
+        )
+        await sender.send(
+            message.answer(text, reply_markup=get_hw_actions_kb(hw["id"], has_sol))
+        )
+
+
+async def pipeline(db, sender, message):
+    homeworks = await db.get_homework_feed(9, "А")
+    methods = (card_method(message, render_homework(hw)) for hw in homeworks)
+    await sender.send_many(methods)
+
+
+# Как send_homework_page: страница карточек и кнопка следующей страницы
+async def page(db, sender, message):
+    homeworks = await db.get_homework_feed(9, "А", limit=HOMEWORK_PAGE_SIZE + 1)
+    methods = [
+        card_method(message, render_homework(hw)) for hw in homeworks[:HOMEWORK_PAGE_SIZE]
+    ]
+    methods.append(message.answer("Это не все задания."))
+    await sender.send_many(methods)
+
+
+# Вариант -> (показ ленты, сколько сообщений получает ученик)
+MODES = {
+    "per card": (per_card, ITEMS),
+    "pipeline": (pipeline, ITEMS),
+    "page": (page, HOMEWORK_PAGE_SIZE + 1),
+}
+
+
+async def run(path, mode, students):
+    db = Database(path)
+    await db.connect()
+    bot = MockBot(LATENCY)
+    sender = Sender(bot, global_rate=1e6, global_burst=1e6, chat_rate=1e6, chat_burst=1e6, workers=64)
+    await sender.start()
+    show, messages = MODES[mode]
+
+    async def student(chat_id):
+        await show(db, sender, make_message(bot, chat_id))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(student(i) for i in range(1, students + 1)))
+    await sender.close()
+    await db.close()
+    assert bot.calls == students * messages
+
+    first = sorted(first - start for first, _ in bot.delivered.values())
+    last = sorted(last - start for _, last in bot.delivered.values())
+    return first[len(first) // 2] * 1000, last[len(last) // 2] * 1000, last[-1] * 1000
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await prepare(path)
+
+        for students in (1, STUDENTS):
+            for mode in MODES:
+                # Медиана по нескольким прогонам: на загруженной машине разброс велик
+                runs = [await run(path, mode, students) for _ in range(ROUNDS)]
+                runs.sort(key=lambda result: result[1])
+                first, last, worst = runs[len(runs) // 2]
+                print(
+                    f"students={students:2} {mode:8}: first message p50 {first:6.1f} ms, "
+                    f"last message p50 {last:6.1f} ms, max {worst:6.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
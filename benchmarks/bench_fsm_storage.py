@@ -0,0 +1,100 @@
+"""Память на незаконченный диалог: MemoryStorage против SQLiteStorage.
+
+FLOWS учеников начинают добавлять решение (состояние + hw_id, текст и три
+фото в data) и бросают его; еще IDLE пользователей просто пишут боту, и FSM
+спрашивает их состояние. Память меряется tracemalloc после сохранения.
+Затем хранилище открывается заново, как после перезапуска бота.
+
+Запуск из корня репозитория: python benchmarks/bench_fsm_storage.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database import Database
+from states import AddSolution
+from storage import SQLiteStorage
+
+FLOWS = 20000
+IDLE = 20000
+HOT_SIZE = 1024
+
+
+def key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def fill(storage):
+    for user_id in range(1, FLOWS + 1):
+        await storage.set_state(key(user_id), AddSolution.waiting_for_content)
+        await storage.update_data(key(user_id), {"hw_id": user_id % 500})
+        await storage.update_data(key(user_id), {"sol_text": f"Решение номер {user_id}"})
+        await storage.update_data(
+            key(user_id), {"sol_photos": [f"AgACAgIAAxkBAAI{user_id}_{i}" for i in range(3)]}
+        )
+    for user_id in range(FLOWS + 1, FLOWS + IDLE + 1):
+        await storage.get_state(key(user_id))
+
+
+async def measure(make_storage):
+    tracemalloc.start()
+    storage = make_storage()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    await fill(storage)
+    if isinstance(storage, SQLiteStorage):
+        await storage.flush()
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return storage, used, elapsed
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.create_tables()
+
+        for name, make_storage in (
+            ("memory", MemoryStorage),
+            ("sqlite", lambda: SQLiteStorage(db, hot_size=HOT_SIZE)),
+        ):
+            storage, used, elapsed = await measure(make_storage)
+            if isinstance(storage, SQLiteStorage):
+                in_memory = storage.stats()["hot"]
+            else:
+                in_memory = len(storage.storage)
+            print(
+                f"{name:6}: {used / 1024 / 1024:6.1f} MiB on {FLOWS} flows + {IDLE} idle, "
+                f"{used / FLOWS:5.0f} B per flow, {in_memory} keys in memory, "
+                f"fill {elapsed:5.2f} s"
+            )
+            await storage.close()
+
+        # Перезапуск: MemoryStorage все забыл, SQLiteStorage читает по требованию
+        await db.close()
+        db = Database(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        storage = SQLiteStorage(db, hot_size=HOT_SIZE)
+        state = await storage.get_state(key(FLOWS // 2))
+        data = await storage.get_data(key(FLOWS // 2))
+        elapsed = time.perf_counter() - start
+        print(
+            f"restart: first read {elapsed * 1000:.1f} ms, "
+            f"state {state}, photos {len(data['sol_photos'])}"
+        )
+        await storage.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Цена клавиатуры в одном ответе: сборка разметки + сериализация запроса.
+
+"build" - клавиатура собирается заново на каждый ответ, как раньше;
+"cached" - готовый объект из keyboards.py. Сериализация повторяет то, что
+делает сессия aiogram перед отправкой (model_dump метода + prepare_value).
+
+Запуск из корня репозитория: python benchmarks/bench_keyboards.py
+"""
+
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+
+from keyboards import (
+    _build_date_kb,
+    get_date_selection_kb,
+    get_hw_actions_kb,
+    get_main_menu_kb,
+    get_solution_votes_kb,
+)
+
+REPLIES = 5000
+
+
+# Так главное меню собиралось до кэширования
+def build_main_menu_kb():
+    kb = [
+        [KeyboardButton(text="📚 Узнать ДЗ"), KeyboardButton(text="➕ Добавить ДЗ")],
+        [KeyboardButton(text="👥 Мой класс"), KeyboardButton(text="👤 Профиль")],
+        [KeyboardButton(text="🏆 Топ учеников")],
+    ]
+    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+
+
+CASES = {
+    "main menu": (build_main_menu_kb, get_main_menu_kb),
+    "date": (
+        lambda: _build_date_kb.__wrapped__(datetime.date.today()),
+        get_date_selection_kb,
+    ),
+    "hw actions": (
+        lambda: get_hw_actions_kb.__wrapped__(15, True),
+        lambda: get_hw_actions_kb(15, True),
+    ),
+    "votes": (
+        lambda: get_solution_votes_kb.__wrapped__(40, 3, 1),
+        lambda: get_solution_votes_kb(40, 3, 1),
+    ),
+}
+
+
+def serialize(bot, method):
+    files = {}
+    return {
+        key: bot.session.prepare_value(value, bot=bot, files=files)
+        for key, value in method.model_dump(warnings=False).items()
+    }
+
+
+def measure(bot, make_kb):
+    make_kb()
+    start = time.perf_counter()
+    for _ in range(REPLIES):
+        make_kb()
+    build = (time.perf_counter() - start) / REPLIES
+
+    kb = make_kb()
+    start = time.perf_counter()
+    for _ in range(REPLIES):
+        serialize(bot, SendMessage(chat_id=1, text="Ответ", reply_markup=kb))
+    send = (time.perf_counter() - start) / REPLIES
+    return build * 1e6, send * 1e6
+
+
+def main():
+    bot = Bot("42:BENCHMARK")
+    for name, (build, cached) in CASES.items():
+        for mode, make_kb in (("build", build), ("cached", cached)):
+            build_us, send_us = measure(bot, make_kb)
+            print(
+                f"{name:10} {mode:6}: markup {build_us:6.1f} us + "
+                f"request {send_us:6.1f} us = {build_us + send_us:6.1f} us per reply"
+            )
+
+
+if __name__ == "__main__":
+    main()
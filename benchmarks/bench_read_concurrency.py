@@ -0,0 +1,117 @@
+"""Параллельные чтения при одновременной записи: один читатель против пула.
+
+Смесь как у бота: READERS учеников листают карточки (задание, страница
+решений, фото - три коротких запроса по индексам), один пользователь
+смотрит рейтинг за месяц (тяжелый агрегат по дневным корзинам), писатель
+начисляет репутацию.
+
+Что показывает замер: база целиком лежит в кэше страниц, поэтому чтения
+упираются в процессор, а не в диск. На одном ядре пул не дает роста
+чтений в секунду - рост пропускной способности этим замером не показан,
+для него нужны несколько ядер или база, которая не помещается в память.
+Пул убирает только очередь за тяжелым запросом: короткие чтения не ждут,
+пока досчитается рейтинг, и хвост задержек (p99) короче. Медиана при этом
+немного растет из-за переключения потоков.
+
+Запуск из корня репозитория: python benchmarks/bench_read_concurrency.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+READERS = 8
+READS_PER_READER = 100
+RANKINGS = 20
+WRITES = 100
+USERS = 500
+HOMEWORKS = 200
+ROUNDS = 3
+
+
+async def prepare(path):
+    db = Database(path)
+    await db.create_tables()
+    await db.seed_subjects()
+    for user_id in range(1, USERS + 1):
+        await db.register_user(user_id, "Имя", "Фамилия", 9, "АБВГ"[user_id % 4])
+    for hw_id in range(1, HOMEWORKS + 1):
+        await db.add_homework(1, 9, "А", f"Задание {hw_id}", None, "2099-01-01", hw_id, 0)
+        for author_id in (hw_id, hw_id + 1):
+            sol_id = await db.add_solution(hw_id, author_id, "Решение", 0)
+            await db.add_solution_media_many(sol_id, ["photo_1", "photo_2"])
+
+    # Дневные корзины за месяц: рейтинг за период агрегирует их в SQL
+    async def fill(conn):
+        await conn.executemany(
+            """INSERT INTO reputation_buckets (span, day, user_id, delta)
+               VALUES ('day', date('now', 'localtime', ?), ?, ?)""",
+            [
+                (f"-{day} days", user_id, (user_id * day) % 7)
+                for user_id in range(1, USERS + 1)
+                for day in range(30)
+            ],
+        )
+
+    await db._write(fill)
+    await db.close()
+
+
+async def run(path, pool_size):
+    db = Database(path, pool_size=pool_size)
+    await db.connect()
+    latencies = []
+
+    # Одна карточка: задание, первая страница решений и фото решений
+    async def reader(offset):
+        for i in range(READS_PER_READER):
+            hw_id = (i * READERS + offset) % HOMEWORKS + 1
+            start = time.perf_counter()
+            await db.get_homework_by_id(hw_id)
+            await db.get_solutions_bundle(hw_id, limit=5)
+            latencies.append(time.perf_counter() - start)
+
+    async def ranking():
+        for _ in range(RANKINGS):
+            await db.get_top_users_for_period(30)
+
+    async def writer():
+        for i in range(WRITES):
+            await db.update_reputation(i % USERS + 1, 1)
+
+    start = time.perf_counter()
+    await asyncio.gather(writer(), ranking(), *(reader(i) for i in range(READERS)))
+    elapsed = time.perf_counter() - start
+    await db.close()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    return len(latencies) / elapsed, p50, p99
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await prepare(path)
+
+        print(f"CPU: {os.cpu_count()}")
+        for pool_size in (1, 4):
+            # Медиана по нескольким прогонам: на загруженной машине разброс велик
+            runs = sorted([await run(path, pool_size) for _ in range(ROUNDS)])
+            cards, p50, p99 = runs[len(runs) // 2]
+            print(
+                f"readers={pool_size}: {cards:6.0f} cards/s, "
+                f"p50 {p50:6.2f} ms, p99 {p99:6.2f} ms "
+                f"(+{RANKINGS} rankings, +{WRITES} writes)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
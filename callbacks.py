@@ -0,0 +1,113 @@
+from typing import Any, Callable, Dict, Literal, Optional, Type, Union
+
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+from middlewares import check_access
+
+SEP = "_"
+
+
+# --- Данные кнопок: формат совпадает со старыми строками вида vote_up_12,
+# поэтому кнопки в уже отправленных сообщениях продолжают работать ---
+class SolveCallback(CallbackData, prefix="solve", sep=SEP):
+    hw_id: int
+
+
+class ViewCallback(CallbackData, prefix="view", sep=SEP):
+    hw_id: int
+
+
+class VoteCallback(CallbackData, prefix="vote", sep=SEP):
+    action: Literal["up", "down"]
+    sol_id: int
+
+
+class ReportCallback(CallbackData, prefix="report", sep=SEP):
+    kind: Literal["hw", "sol"]
+    target_id: int
+
+
+# day - дата YYYY-MM-DD или manual
+class DateCallback(CallbackData, prefix="date", sep=SEP):
+    day: str
+
+
+class HomeworkPageCallback(CallbackData, prefix="hw", sep=SEP):
+    kind: Literal["page"] = "page"
+    target_date: str
+    hw_id: int
+
+
+class SolutionPageCallback(CallbackData, prefix="sol", sep=SEP):
+    kind: Literal["page"] = "page"
+    hw_id: int
+    score: int
+    sol_id: int
+
+
+class ChangeCallback(CallbackData, prefix="change", sep=SEP):
+    kind: Literal["grade", "name"]
+
+
+class TopCallback(CallbackData, prefix="top", sep=SEP):
+    period: Literal["week", "month"]
+
+
+class _Route:
+    __slots__ = ("callback_data", "handler", "access")
+
+    def __init__(self, callback_data: Type[CallbackData], handler: Callable, access: Optional[str]):
+        self.callback_data = callback_data
+        self.handler = CallableObject(handler)
+        self.access = access
+
+
+# --- Маршрутизация нажатий по таблице префиксов ---
+# Вместо перебора фильтров F.data.startswith(...) один обработчик находит
+# маршрут поиском в словаре и передает его обработчику разобранный
+# callback_data с уже числовыми полями. Права - те же, что у флага access
+class CallbackRouter:
+    def __init__(self):
+        # Префикс -> маршрут, или -> {вид: маршрут}, если у префикса
+        # несколько обработчиков (report_hw / report_sol)
+        self._routes: Dict[str, Union[_Route, Dict[str, _Route]]] = {}
+
+    def route(
+        self,
+        callback_data: Type[CallbackData],
+        kind: Optional[str] = None,
+        access: Optional[str] = None,
+    ):
+        def decorator(handler: Callable) -> Callable:
+            route = _Route(callback_data, handler, access)
+            prefix = callback_data.__prefix__
+            if kind is None:
+                self._routes[prefix] = route
+            else:
+                self._routes.setdefault(prefix, {})[kind] = route
+            return handler
+
+        return decorator
+
+    def find(self, data: str) -> Optional[_Route]:
+        prefix, _, rest = data.partition(SEP)
+        route = self._routes.get(prefix)
+        if type(route) is dict:
+            route = route.get(rest.partition(SEP)[0])
+        return route
+
+    async def dispatch(self, callback: CallbackQuery, **data: Any) -> Any:
+        route = self.find(callback.data or "")
+        if route is None:
+            raise SkipHandler()
+        try:
+            callback_data = route.callback_data.unpack(callback.data)
+        except (TypeError, ValueError):
+            raise SkipHandler()
+
+        if route.access is not None and not await check_access(route.access, callback, data):
+            return None
+        return await route.handler.call(callback, callback_data=callback_data, **data)
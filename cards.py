@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto, Message
+
+from cache import MISSING, TTLCache
+from keyboards import get_hw_actions_kb, get_solution_votes_kb
+
+
+# --- Карточки ленты: сначала все строятся в памяти, потом разом отправляются ---
+# Рендеринг - чистые функции от строк базы: без запросов и без сети
+class Card(NamedTuple):
+    text: str
+    photo_id: Optional[str] = None
+    media: Tuple[str, ...] = ()
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+
+
+def render_homework(hw: Dict[str, Any]) -> Card:
+    display_date = datetime.strptime(hw["target_date"], "%Y-%m-%d").strftime("%d.%m")
+    author_name = hw["author_name"] or "Анонимно"
+
+    text = (
+        f"📌 <b>Предмет:</b> {hw['subject_name']}\n"
+        f"📝 <b>Задание:</b> {hw['text']}\n"
+        f"⏳ <b>День:</b> {display_date}\n"
+        f"👤 <b>Автор:</b> {author_name}"
+    )
+    kb = get_hw_actions_kb(hw["id"], hw["solution_count"] > 0)
+    return Card(text, photo_id=hw["photo_id"], reply_markup=kb)
+
+
+def render_solution(sol: Dict[str, Any]) -> List[Card]:
+    author_text = sol["author_name"] or "Анонимно"
+    caption_text = f"✅ <b>Решение от:</b> {author_text}\n\n{sol['text'] or '<i>(Без текста)</i>'}"
+    kb = get_solution_votes_kb(sol["id"], sol["ups"], sol["downs"])
+
+    if not sol["media"]:
+        return [Card(caption_text, reply_markup=kb)]
+
+    # У альбома не бывает кнопок, поэтому оценка идет отдельным сообщением
+    return [
+        Card(caption_text, media=tuple(sol["media"])),
+        Card("Оцените решение: 👆", reply_markup=kb),
+    ]
+
+
+def card_method(message: Message, card: Card) -> TelegramMethod:
+    if card.media:
+        media = [InputMediaPhoto(media=card.media[0], caption=card.text)]
+        media += [InputMediaPhoto(media=file_id) for file_id in card.media[1:]]
+        return message.answer_media_group(media)
+
+    if card.photo_id:
+        return message.answer_photo(
+            card.photo_id, caption=card.text, reply_markup=card.reply_markup
+        )
+
+    return message.answer(card.text, reply_markup=card.reply_markup)
+
+
+# --- Кэш готовых карточек: ключ (id, version), версию поднимает база ---
+# Пока версия не изменилась, карточка та же для всех учеников класса
+_cards = TTLCache(maxsize=4096, ttl=3600.0)
+
+
+def cache_stats():
+    return _cards.stats()
+
+
+def homework_card(hw: Dict[str, Any]) -> Card:
+    key = ("homework", hw["id"], hw["version"])
+    card = _cards.get(key)
+    if card is MISSING:
+        card = render_homework(hw)
+        _cards.set(key, card)
+    return card
+
+
+def cached_solution_cards(sol: Dict[str, Any]) -> Optional[List[Card]]:
+    cards = _cards.get(("solution", sol["id"], sol["version"]))
+    return None if cards is MISSING else cards
+
+
+# sol должен содержать media: его догружают только для промахов кэша
+def solution_cards(sol: Dict[str, Any]) -> List[Card]:
+    cards = render_solution(sol)
+    _cards.set(("solution", sol["id"], sol["version"]), cards)
+    return cards
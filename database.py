@@ -1,13 +1,556 @@
-from typing import Any, List, Dict, Optional, Union
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Dict, Hashable, Mapping, Optional, Set, Tuple, Union
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
+import asyncio
+import logging
+import sqlite3
 import aiosqlite
 
+from cache import MISSING, TTLCache
+from leaderboard import Leaderboard
+
+logger = logging.getLogger(__name__)
+
+WriteJob = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+# --- Единица работы: одна транзакция на весь апдейт ---
+ROLLBACK = object()
+
+
+class RolledBack(Exception):
+    pass
+
+
+class UnitOfWork:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.hooks: List[Callable[[], Any]] = []
+        self.runner: Optional[asyncio.Future] = None
+
+
+def _fail_pending(queue: asyncio.Queue):
+    # Если транзакция оборвалась, никто не должен ждать ответа вечно
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is not None and item is not ROLLBACK and not item[1].done():
+            item[1].set_exception(RuntimeError("Транзакция апдейта уже завершена"))
+
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar("current_uow", default=None)
+
+# --- Миграции схемы: (версия, запросы). Новые миграции добавлять только в конец ---
+MIGRATIONS = [
+    (
+        1,
+        [
+            "CREATE INDEX IF NOT EXISTS idx_homework_class ON homework (grade, letter, target_date, created_at DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_homework_target_date ON homework (target_date)",
+            "CREATE INDEX IF NOT EXISTS idx_solutions_homework ON solutions (homework_id)",
+            "CREATE INDEX IF NOT EXISTS idx_votes_solution ON votes (solution_id, vote_value)",
+            "CREATE INDEX IF NOT EXISTS idx_media_parent ON media (parent_id, parent_type, file_id)",
+            "CREATE INDEX IF NOT EXISTS idx_users_reputation ON users (reputation)",
+            "CREATE INDEX IF NOT EXISTS idx_users_class ON users (grade, letter, reputation)",
+        ],
+    ),
+    (
+        2,
+        [
+            "ALTER TABLE solutions ADD COLUMN ups INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE solutions ADD COLUMN downs INTEGER NOT NULL DEFAULT 0",
+            """UPDATE solutions SET
+                ups = (SELECT COUNT(*) FROM votes
+                       WHERE votes.solution_id = solutions.id AND vote_value = 1),
+                downs = (SELECT COUNT(*) FROM votes
+                         WHERE votes.solution_id = solutions.id AND vote_value = -1)""",
+        ],
+    ),
+    (
+        3,
+        [
+            # votes пересоздается, чтобы голоса удалялись вместе с решением
+            """CREATE TABLE votes_new (
+                user_id INTEGER,
+                solution_id INTEGER,
+                vote_value INTEGER,
+                PRIMARY KEY (user_id, solution_id),
+                FOREIGN KEY (solution_id) REFERENCES solutions (id) ON DELETE CASCADE
+            )""",
+            """INSERT INTO votes_new (user_id, solution_id, vote_value)
+               SELECT user_id, solution_id, vote_value FROM votes
+               WHERE solution_id IN (SELECT id FROM solutions)""",
+            "DROP TABLE votes",
+            "ALTER TABLE votes_new RENAME TO votes",
+            "CREATE INDEX IF NOT EXISTS idx_votes_solution ON votes (solution_id, vote_value)",
+            # media и reports ссылаются и на задания, и на решения, поэтому
+            # вместо внешних ключей у них триггеры
+            """CREATE TRIGGER IF NOT EXISTS trg_homework_cleanup
+               AFTER DELETE ON homework BEGIN
+                   DELETE FROM media WHERE parent_type = 'homework' AND parent_id = OLD.id;
+                   DELETE FROM reports WHERE type = 'homework' AND sol_or_hw_id = OLD.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_solutions_cleanup
+               AFTER DELETE ON solutions BEGIN
+                   DELETE FROM media WHERE parent_type = 'solution' AND parent_id = OLD.id;
+                   DELETE FROM reports WHERE type = 'solution' AND sol_or_hw_id = OLD.id;
+               END""",
+            # Без индекса каждый удаленный объект - полный проход по reports
+            "CREATE INDEX IF NOT EXISTS idx_reports_target ON reports (sol_or_hw_id, type)",
+        ],
+    ),
+    (
+        4,
+        [
+            # Журнал изменений репутации: только добавление
+            """CREATE TABLE IF NOT EXISTS reputation_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                delta INTEGER,
+                reason TEXT,
+                created_at TEXT DEFAULT (datetime('now', 'localtime'))
+            )""",
+            # Суммы по дням (span='day'), старые дни сворачиваются в месяцы (span='month')
+            """CREATE TABLE IF NOT EXISTS reputation_buckets (
+                span TEXT,
+                day TEXT,
+                user_id INTEGER,
+                delta INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (span, day, user_id)
+            )""",
+        ],
+    ),
+    (
+        5,
+        [
+            # Индексы под постраничный вывод: лента по (target_date, id),
+            # решения по рейтингу. Индекс по homework_id покрыт новым
+            "DROP INDEX IF EXISTS idx_homework_class",
+            "CREATE INDEX IF NOT EXISTS idx_homework_class ON homework (grade, letter, target_date, id)",
+            "DROP INDEX IF EXISTS idx_solutions_homework",
+            "CREATE INDEX IF NOT EXISTS idx_solutions_score ON solutions (homework_id, (ups - downs) DESC, id)",
+        ],
+    ),
+    (
+        6,
+        [
+            # Версия карточки: растет при каждом изменении того, что на ней видно
+            # (число решений, голоса, фото, имя автора)
+            "ALTER TABLE homework ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE solutions ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    (
+        7,
+        [
+            # Состояния FSM: незаконченные диалоги переживают перезапуск бота
+            """CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID""",
+            "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)",
+        ],
+    ),
+]
+
+# --- Условия, по которым строка считается осиротевшей (порядок важен) ---
+ORPHANS = [
+    ("solutions", "NOT EXISTS (SELECT 1 FROM homework h WHERE h.id = solutions.homework_id)"),
+    ("votes", "NOT EXISTS (SELECT 1 FROM solutions s WHERE s.id = votes.solution_id)"),
+    (
+        "media",
+        """(parent_type = 'solution'
+            AND NOT EXISTS (SELECT 1 FROM solutions s WHERE s.id = media.parent_id))
+           OR (parent_type = 'homework'
+            AND NOT EXISTS (SELECT 1 FROM homework h WHERE h.id = media.parent_id))""",
+    ),
+    (
+        "reports",
+        """(type = 'solution'
+            AND NOT EXISTS (SELECT 1 FROM solutions s WHERE s.id = reports.sol_or_hw_id))
+           OR (type = 'homework'
+            AND NOT EXISTS (SELECT 1 FROM homework h WHERE h.id = reports.sol_or_hw_id))""",
+    ),
+]
+
 
 class Database:
-    def __init__(self, db_path):
+    # Применяются к каждому соединению при открытии
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16000,
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+    }
+
+    def __init__(
+        self,
+        db_path,
+        pool_size: int = 4,
+        user_cache_size: int = 2048,
+        user_cache_ttl: float = 300.0,
+        write_behind: bool = False,
+        flush_interval: float = 0.05,
+        flush_max_items: int = 100,
+        feed_cache_size: int = 256,
+        feed_cache_ttl: float = 30.0,
+    ):
         self.db_path = db_path
+        self.pool_size = pool_size
+        # Отложенная запись голосов и репутации: копим и пишем одной транзакцией
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_max_items = flush_max_items
+        self._pending_votes: Dict[Tuple[int, int], int] = {}
+        self._pending_counters: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        self._pending_reputation: Dict[Tuple[int, str], int] = defaultdict(int)
+        self._pending_items = 0
+        # Пачка, которую сейчас пишет flush: до коммита она видна чтениям
+        # и проверке повторного голоса, при ошибке возвращается в буферы
+        self._flushing_votes: Dict[Tuple[int, int], int] = {}
+        self._flushing_counters: Dict[int, List[int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_wanted = asyncio.Event()
+        self._flush_full = asyncio.Event()
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._users = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # Растет при каждой инвалидации, чтобы не положить в кэш строку,
+        # прочитанную до параллельной записи
+        self._users_generation = 0
+        # Ленты классов: короткий кэш и один общий запрос на одинаковые чтения
+        self._feeds = TTLCache(maxsize=feed_cache_size, ttl=feed_cache_ttl)
+        self._feeds_generation: Dict[Tuple[int, str], int] = defaultdict(int)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.leaderboard = Leaderboard()
+        # Забаненные и админы: права проверяются без запросов к базе
+        self._banned: Set[int] = set()
+        self._admins: Set[int] = set()
+        # Каталог предметов: неизменяемый снимок таблицы subjects
+        self._subjects: Optional[Tuple[Mapping[str, Any], ...]] = None
+        self._subjects_by_name: Mapping[str, Mapping[str, Any]] = MappingProxyType({})
+        self._subjects_by_id: Mapping[int, Mapping[str, Any]] = MappingProxyType({})
+        self._connect_lock = asyncio.Lock()
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    # --- Пул соединений: открывается один раз при старте бота ---
+    async def _open_connection(self, readonly: bool = False) -> aiosqlite.Connection:
+        if readonly:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = await aiosqlite.connect(uri, uri=True)
+        else:
+            conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        for name, value in self.PRAGMAS.items():
+            await conn.execute(f"PRAGMA {name} = {value}")
+        if readonly:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._pool is not None:
+                return
+
+            # Писатель открывается первым: он создает файл и переводит его в WAL
+            self._writer = await self._open_connection()
+            self._connections.append(self._writer)
+
+            # Читатели открыты только на чтение: в WAL они работают параллельно
+            # друг с другом и с писателем, а случайная запись через них упадет
+            pool = asyncio.Queue()
+            for _ in range(self.pool_size):
+                conn = await self._open_connection(readonly=True)
+                self._connections.append(conn)
+                pool.put_nowait(conn)
+
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+            if self.write_behind:
+                self._flusher_task = asyncio.create_task(self._flusher_loop())
+            self._pool = pool
+
+        applied = []
+        for name in self.PRAGMAS:
+            cursor = await self._writer.execute(f"PRAGMA {name}")
+            row = await cursor.fetchone()
+            applied.append(f"{name}={row[0] if row else None}")
+        logger.info(
+            "SQLite %s: %s, читателей %s", self.db_path, ", ".join(applied), self.pool_size
+        )
+
+    async def close(self):
+        if self._flusher_task is not None:
+            # Под блокировкой: не прерываем сброс, который уже пишет пачку
+            async with self._flush_lock:
+                self._flusher_task.cancel()
+                await asyncio.gather(self._flusher_task, return_exceptions=True)
+            self._flusher_task = None
+        try:
+            if self._writer_task is not None:
+                # Отложенные голоса и репутация не должны потеряться при остановке
+                await self.flush()
+        finally:
+            if self._writer_task is not None:
+                # Дожидаемся, пока писатель допишет все, что уже в очереди
+                self._write_queue.put_nowait(None)
+                await self._writer_task
+                self._writer_task = None
+                self._write_queue = None
+
+            for conn in self._connections:
+                await conn.close()
+            self._connections.clear()
+            self._writer = None
+            self._pool = None
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._pool is None:
+            await self.connect()
+
+        pool = self._pool
+        conn = await pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put_nowait(conn)
+
+    # --- Единственный писатель: все изменения базы идут через одну очередь ---
+    async def _writer_loop(self):
+        while True:
+            item = await self._write_queue.get()
+            if item is None:
+                return
+
+            job, future = item
+            try:
+                result = await job(self._writer)
+                await self._writer.commit()
+            except Exception as e:
+                await self._writer.rollback()
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            # Не держать замыкание и параметры последней записи до следующей
+            item = job = future = result = None
+
+    def _submit(self, job: WriteJob) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((job, future))
+        return future
+
+    async def _write(self, job: WriteJob) -> Any:
+        if self._pool is None:
+            await self.connect()
+
+        uow = _current_uow.get()
+        if uow is None:
+            return await self._submit(job)
+
+        if uow.runner is None:
+            queue = uow.queue
+            uow.runner = self._submit(lambda db: self._run_unit_of_work(db, queue))
+            uow.runner.add_done_callback(lambda _: _fail_pending(queue))
+
+        future = asyncio.get_running_loop().create_future()
+        uow.queue.put_nowait((job, future))
+        return await future
+
+    # Занимает писателя с первой записи апдейта до его конца. Каждый шаг
+    # обернут в SAVEPOINT: ошибка одного метода (например, повторный голос)
+    # не откатывает остальные
+    @staticmethod
+    async def _run_unit_of_work(db: aiosqlite.Connection, queue: asyncio.Queue):
+        await db.execute("BEGIN")
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if item is ROLLBACK:
+                raise RolledBack()
+
+            job, future = item
+            await db.execute("SAVEPOINT step")
+            try:
+                result = await job(db)
+            except Exception as e:
+                await db.execute("ROLLBACK TO step")
+                await db.execute("RELEASE step")
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                await db.execute("RELEASE step")
+                if not future.cancelled():
+                    future.set_result(result)
+
+    async def _finish_unit_of_work(self, uow: UnitOfWork, commit: bool):
+        runner, hooks = uow.runner, uow.hooks
+        if runner is not None:
+            uow.queue.put_nowait(None if commit else ROLLBACK)
+        uow.reset()
+        if runner is not None:
+            try:
+                await runner
+            except RolledBack:
+                return
+        elif not commit:
+            # Апдейт не писал в базу, но мог отложить запись в буферы
+            return
+
+        for hook in hooks:
+            hook()
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator["Database"]:
+        uow = UnitOfWork()
+        token = _current_uow.set(uow)
+        try:
+            yield self
+        except BaseException:
+            await self._finish_unit_of_work(uow, commit=False)
+            raise
+        else:
+            await self._finish_unit_of_work(uow, commit=True)
+        finally:
+            _current_uow.reset(token)
+
+    # Досрочно фиксирует транзакцию апдейта, например перед отправкой сообщений.
+    # Следующая запись в этом апдейте откроет новую транзакцию
+    async def commit(self):
+        uow = _current_uow.get()
+        if uow is not None:
+            await self._finish_unit_of_work(uow, commit=True)
+
+    # Кэши в памяти и буферы отложенной записи обновляются только после
+    # фиксации апдейта: при откате колбэк не вызывается
+    def _after_commit(self, callback: Callable[[], Any]):
+        uow = _current_uow.get()
+        if uow is not None:
+            uow.hooks.append(callback)
+        else:
+            callback()
+
+    # --- Отложенная запись: голоса и репутация копятся и сбрасываются пачкой ---
+    def queue_depth(self) -> Dict[str, int]:
+        return {
+            "writer": self._write_queue.qsize() if self._write_queue else 0,
+            "write_behind": self._pending_items,
+        }
+
+    def _buffered(self):
+        self._pending_items += 1
+        self._flush_wanted.set()
+        if self._pending_items >= self.flush_max_items:
+            self._flush_full.set()
+
+    async def _flusher_loop(self):
+        while True:
+            await self._flush_wanted.wait()
+            try:
+                await asyncio.wait_for(self._flush_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wanted.clear()
+            self._flush_full.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сбросить отложенные голоса и репутацию")
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush_batch()
+
+    async def _flush_batch(self):
+        if not self._pending_items:
+            return
+
+        votes, self._pending_votes = self._pending_votes, {}
+        pending, self._pending_counters = self._pending_counters, defaultdict(lambda: [0, 0])
+        pending_reputation, self._pending_reputation = self._pending_reputation, defaultdict(int)
+        items, self._pending_items = self._pending_items, 0
+        self._flushing_votes = votes
+        self._flushing_counters = pending
+
+        async def job(db):
+            # Копия: при ошибке в буферы вернется только накопленное вызовами
+            reputation = defaultdict(int, pending_reputation)
+            counters = defaultdict(lambda: [0, 0])
+            for (user_id, sol_id), value in votes.items():
+                cursor = await db.execute(
+                    """INSERT OR IGNORE INTO votes (user_id, solution_id, vote_value)
+                       SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM solutions WHERE id = ?)""",
+                    (user_id, sol_id, value, sol_id),
+                )
+                if cursor.rowcount:
+                    counters[sol_id][0 if value > 0 else 1] += 1
+
+            if counters:
+                await db.executemany(
+                    """UPDATE solutions SET ups = ups + ?, downs = downs + ?,
+                                            version = version + ? WHERE id = ?""",
+                    [
+                        (ups, downs, ups + downs, sol_id)
+                        for sol_id, (ups, downs) in counters.items()
+                    ],
+                )
+                marks = ",".join("?" * len(counters))
+                cursor = await db.execute(
+                    f"SELECT id, author_id FROM solutions WHERE id IN ({marks})",
+                    list(counters),
+                )
+                for row in await cursor.fetchall():
+                    ups, downs = counters[row["id"]]
+                    reputation[(row["author_id"], "vote")] += ups - downs
+
+            changed = defaultdict(int)
+            for (user_id, reason), delta in reputation.items():
+                if delta:
+                    await self._apply_reputation(db, user_id, delta, reason)
+                    changed[user_id] += delta
+            return changed
+
+        try:
+            changed = await self._write(job)
+        except Exception:
+            # Не потерять голоса и репутацию: вернуть пачку в буферы
+            self._pending_votes.update(votes)
+            for sol_id, (ups, downs) in pending.items():
+                counter = self._pending_counters[sol_id]
+                counter[0] += ups
+                counter[1] += downs
+            for key, delta in pending_reputation.items():
+                self._pending_reputation[key] += delta
+            self._pending_items += items
+            self._flush_wanted.set()
+            raise
+        finally:
+            self._flushing_votes = {}
+            self._flushing_counters = {}
+
+        for user_id, delta in changed.items():
+            self._user_changed(user_id, reputation=delta)
 
     # --- Приватный метод-движок для сокращения кода ---
+    # Маршрут выбирает сам метод: fetch/fetchone - чтение из пула читателей,
+    # иначе - запись через единственного писателя
     async def _execute(
         self,
         query: str,
@@ -16,20 +559,31 @@ class Database:
         fetchone: bool = False,
     ) -> Union[List[Dict[str, Any]], Dict[str, Any], None, aiosqlite.Cursor]:
 
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        if not fetch and not fetchone:
+            return await self._write(lambda db: db.execute(query, params))
+
+        uow = _current_uow.get()
+        if uow is not None and uow.runner is not None:
+            # После первой записи апдейт читает через свою транзакцию,
+            # чтобы видеть собственные изменения
+            async def read(db):
+                cursor = await db.execute(query, params)
+                if fetchone:
+                    row = await cursor.fetchone()
+                    return dict(row) if row else None
+                return [dict(row) for row in await cursor.fetchall()]
+
+            return await self._write(read)
+
+        async with self._acquire() as db:
             cursor = await db.execute(query, params)
 
             if fetchone:
                 row = await cursor.fetchone()
                 return dict(row) if row else None
 
-            if fetch:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
-
-            await db.commit()
-            return cursor
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
 
     # --- Создание всех таблиц в базе даных ---
     async def create_tables(self):
@@ -99,6 +653,33 @@ class Database:
         for query in queries:
             await self._execute(query)
 
+        await self.migrate()
+
+    async def migrate(self):
+        await self._execute(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+        )
+        row = await self._execute(
+            "SELECT MAX(version) AS version FROM schema_version", fetchone=True
+        )
+        current = row["version"] or 0
+
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+
+            # Каждая миграция применяется целиком или не применяется вовсе
+            async def job(db, version=version, statements=statements):
+                await db.execute("BEGIN")
+                for query in statements:
+                    await db.execute(query)
+                await db.execute(
+                    "INSERT INTO schema_version (version) VALUES (?)", (version,)
+                )
+
+            await self._write(job)
+            logger.info("Схема базы обновлена до версии %s", version)
+
     async def seed_subjects(self):
         subjects = [
             "Алгебра",
@@ -124,91 +705,369 @@ class Database:
                 "INSERT OR IGNORE INTO subjects (name) VALUES (?)", (subject,)
             )
 
+        await self.load_subjects()
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"users": self._users.stats(), "feeds": self._feeds.stats()}
+
+    # --- Состояния FSM: строка на ключ, data хранится в JSON ---
+    async def get_fsm_state(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self._execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+            (key,),
+            fetchone=True,
+        )
+
+    # rows: (key, state, data, updated_at); пустое состояние удаляет строку
+    async def save_fsm_states(self, rows: List[Tuple[str, Optional[str], str, float]]):
+        async def job(db):
+            await db.executemany(
+                """INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       state = excluded.state,
+                       data = excluded.data,
+                       updated_at = excluded.updated_at""",
+                [row for row in rows if row[1] is not None or row[2] != "{}"],
+            )
+            await db.executemany(
+                "DELETE FROM fsm_states WHERE key = ?",
+                [(row[0],) for row in rows if row[1] is None and row[2] == "{}"],
+            )
+
+        await self._write(job)
+
+    async def delete_stale_fsm_states(self, before: float) -> int:
+        cursor = await self._execute(
+            "DELETE FROM fsm_states WHERE updated_at < ?", (before,)
+        )
+        return cursor.rowcount
+
     # --- Работа с пользователями ---
+    def _invalidate_user(self, user_id):
+        self._users_generation += 1
+        self._users.pop(int(user_id))
+
+    def _user_changed(self, user_id, reputation: int = 0, **fields):
+        def apply():
+            self._invalidate_user(user_id)
+            if reputation:
+                self.leaderboard.add_reputation(int(user_id), reputation)
+            if fields:
+                self.leaderboard.update(int(user_id), **fields)
+
+        self._after_commit(apply)
+
     async def register_user(self, user_id, first_name, last_name, grade, letter):
-        await self._execute(
+        cursor = await self._execute(
             "INSERT OR IGNORE INTO users (user_id, first_name, last_name, grade, letter) VALUES (?, ?, ?, ?, ?)",
             (user_id, first_name, last_name, grade, letter),
         )
+        if not cursor.rowcount:
+            return
+
+        user = {
+            "user_id": int(user_id),
+            "first_name": first_name,
+            "last_name": last_name,
+            "grade": int(grade),
+            "letter": letter,
+            "reputation": 0,
+        }
+
+        def apply():
+            self._invalidate_user(user_id)
+            if self.leaderboard.loaded:
+                self.leaderboard.upsert(user)
+
+        self._after_commit(apply)
 
     async def get_user(self, user_id):
-        return await self._execute(
-            "SELECT * FROM users WHERE user_id = ?", (user_id,), fetchone=True
-        )
+        key = int(user_id)
+        uow = _current_uow.get()
+        if uow is not None and uow.runner is not None:
+            # Апдейт с незафиксированными записями читает мимо общего кэша:
+            # после отката в кэше не должно остаться его строки
+            return await self._execute(
+                "SELECT * FROM users WHERE user_id = ?", (key,), fetchone=True
+            )
 
-    async def update_reputation(self, user_id, value):
-        await self._execute(
+        user = self._users.get(key)
+        if user is MISSING:
+            generation = self._users_generation
+            user = await self._execute(
+                "SELECT * FROM users WHERE user_id = ?", (key,), fetchone=True
+            )
+            if generation == self._users_generation:
+                self._users.set(key, user)
+
+        return dict(user) if user else None
+
+    @staticmethod
+    async def _apply_reputation(db: aiosqlite.Connection, user_id, value, reason):
+        await db.execute(
             "UPDATE users SET reputation = reputation + ? WHERE user_id = ?",
             (value, user_id),
         )
+        await db.execute(
+            "INSERT INTO reputation_events (user_id, delta, reason) VALUES (?, ?, ?)",
+            (user_id, value, reason),
+        )
+        await db.execute(
+            """INSERT INTO reputation_buckets (span, day, user_id, delta)
+               VALUES ('day', date('now', 'localtime'), ?, ?)
+               ON CONFLICT (span, day, user_id) DO UPDATE SET delta = delta + excluded.delta""",
+            (user_id, value),
+        )
+
+    async def update_reputation(self, user_id, value, reason: str = "manual"):
+        if self.write_behind:
+
+            def buffer():
+                self._pending_reputation[(int(user_id), reason)] += value
+                self._buffered()
+
+            self._after_commit(buffer)
+            return
+
+        await self._write(
+            lambda db: self._apply_reputation(db, user_id, value, reason)
+        )
+        self._user_changed(user_id, reputation=value)
+
+    # --- Рейтинг: читается из памяти, SQL нужен только для начальной загрузки ---
+    async def load_leaderboard(self):
+        users = await self._execute(
+            "SELECT user_id, first_name, last_name, grade, letter, reputation FROM users",
+            fetch=True,
+        )
+        self.leaderboard.load(users)
 
     async def get_top_users(self, limit: int = 5):
-        query = """
-            SELECT first_name, last_name, grade, letter, reputation
-            FROM users
-            ORDER BY reputation DESC
-            LIMIT ?
-        """
-        return await self._execute(query, (limit,), fetch=True)
+        if not self.leaderboard.loaded:
+            await self.load_leaderboard()
+        return self.leaderboard.top(limit)
 
     async def get_class_users(self, grade: int, letter: str):
+        if not self.leaderboard.loaded:
+            await self.load_leaderboard()
+        return self.leaderboard.class_top(grade, letter)
+
+    # Рейтинг за последние days дней по дневным корзинам: на ученика не больше
+    # days строк, журнал событий не читается
+    async def get_top_users_for_period(self, days: int, limit: int = 5):
         query = """
-            SELECT first_name, last_name, reputation
-            FROM users
-            WHERE grade = ? AND letter = ?
+            SELECT u.first_name, u.last_name, u.grade, u.letter, SUM(b.delta) AS reputation
+            FROM reputation_buckets b
+            JOIN users u ON u.user_id = b.user_id
+            WHERE b.span = 'day' AND b.day >= date('now', 'localtime', ?)
+            GROUP BY b.user_id
+            HAVING SUM(b.delta) > 0
             ORDER BY reputation DESC
+            LIMIT ?
         """
-        return await self._execute(query, (grade, letter), fetch=True)
+        return await self._execute(query, (f"-{days - 1} days", limit), fetch=True)
+
+    # Сворачивает дневные корзины старше keep_days в месячные
+    async def compact_reputation(self, keep_days: int = 35):
+        async def job(db):
+            cutoff = f"-{keep_days} days"
+            await db.execute(
+                """INSERT INTO reputation_buckets (span, day, user_id, delta)
+                   SELECT 'month', substr(day, 1, 7) || '-01', user_id, SUM(delta)
+                   FROM reputation_buckets
+                   WHERE span = 'day' AND day < date('now', 'localtime', ?)
+                   GROUP BY substr(day, 1, 7), user_id
+                   ON CONFLICT (span, day, user_id) DO UPDATE SET delta = delta + excluded.delta""",
+                (cutoff,),
+            )
+            cursor = await db.execute(
+                "DELETE FROM reputation_buckets WHERE span = 'day' AND day < date('now', 'localtime', ?)",
+                (cutoff,),
+            )
+            return cursor.rowcount
+
+        return await self._write(job)
+
+    async def get_user_rank(self, user_id):
+        # (место в школе, всего), (место в классе, всего в классе)
+        if not self.leaderboard.loaded:
+            await self.load_leaderboard()
+        key = int(user_id)
+        return self.leaderboard.rank(key), self.leaderboard.class_rank(key)
+
+    # --- Права: множества в памяти, синхронные с колонками is_banned/is_admin ---
+    async def load_access(self):
+        rows = await self._execute(
+            "SELECT user_id, is_banned, is_admin FROM users WHERE is_banned OR is_admin",
+            fetch=True,
+        )
+        self._banned = {row["user_id"] for row in rows if row["is_banned"]}
+        self._admins = {row["user_id"] for row in rows if row["is_admin"]}
+
+    def is_banned(self, user_id) -> bool:
+        return user_id is not None and int(user_id) in self._banned
+
+    def is_admin(self, user_id) -> bool:
+        return user_id is not None and int(user_id) in self._admins
 
     async def ban_user(self, user_id):
         await self._execute(
             "UPDATE users SET is_banned = 1 WHERE user_id = ?", (user_id,)
         )
+        self._user_changed(user_id)
+        self._after_commit(lambda: self._banned.add(int(user_id)))
 
     async def unban_user(self, user_id):
         await self._execute(
             "UPDATE users SET is_banned = 0 WHERE user_id = ?", (user_id,)
         )
+        self._user_changed(user_id)
+        self._after_commit(lambda: self._banned.discard(int(user_id)))
 
     async def set_admin_status(self, user_id, status):
         await self._execute(
             "UPDATE users SET is_admin = ? WHERE user_id = ?", (status, user_id)
         )
+        self._user_changed(user_id)
+        if status:
+            self._after_commit(lambda: self._admins.add(int(user_id)))
+        else:
+            self._after_commit(lambda: self._admins.discard(int(user_id)))
 
     async def update_user_grade(self, user_id, grade, letter):
         await self._execute(
             "UPDATE users SET grade = ?, letter = ? WHERE user_id = ?",
             (grade, letter, user_id),
         )
+        self._user_changed(user_id, grade=grade, letter=letter)
 
     async def update_user_name(self, user_id, first_name, last_name):
-        await self._execute(
-            "UPDATE users SET first_name = ?, last_name = ? WHERE user_id = ?",
-            (first_name, last_name, user_id),
-        )
+        async def job(db):
+            await db.execute(
+                "UPDATE users SET first_name = ?, last_name = ? WHERE user_id = ?",
+                (first_name, last_name, user_id),
+            )
+            # Имя автора видно на его неанонимных карточках
+            for table in ("homework", "solutions"):
+                await db.execute(
+                    f"""UPDATE {table} SET version = version + 1
+                        WHERE author_id = ? AND NOT is_anonymous""",
+                    (user_id,),
+                )
+
+        await self._write(job)
+        self._user_changed(user_id, first_name=first_name, last_name=last_name)
+        self._after_commit(self._invalidate_feeds)
 
     # --- Работа с предметами ---
+    # Таблица subjects меняется только в seed_subjects, поэтому читаем ее один раз
+    async def load_subjects(self):
+        rows = await self._execute("SELECT * FROM subjects ORDER BY id", fetch=True)
+        subjects = tuple(MappingProxyType(row) for row in rows)
+
+        self._subjects = subjects
+        self._subjects_by_name = MappingProxyType({s["name"]: s for s in subjects})
+        self._subjects_by_id = MappingProxyType({s["id"]: s for s in subjects})
+
     async def get_subjects(self):
-        return await self._execute("SELECT * FROM subjects", fetch=True)
+        if self._subjects is None:
+            await self.load_subjects()
+        return self._subjects
 
     async def get_subject_by_name(self, name):
-        return await self._execute(
-            "SELECT * FROM subjects WHERE name = ?", (name,), fetchone=True
-        )
+        if self._subjects is None:
+            await self.load_subjects()
+        return self._subjects_by_name.get(name)
+
+    async def get_subject_by_id(self, subject_id):
+        if self._subjects is None:
+            await self.load_subjects()
+        return self._subjects_by_id.get(subject_id)
 
     # --- Работа с домашкой ---
-    async def delete_expired_homework(self):
+    # Удаляет просроченные задания пачками, чтобы не держать писателя надолго.
+    # Решения, голоса, медиа и жалобы удаляются каскадом.
+    # Вызывается фоновой задачей, а не из обработчиков
+    async def delete_expired_homework(self, batch_size: int = 500):
         today = datetime.now().strftime("%Y-%m-%d")
-        await self._execute(
-            """
-                    DELETE FROM media 
-                    WHERE parent_type = 'solution' 
-                    AND parent_id IN (SELECT id FROM solutions WHERE homework_id IN (SELECT id FROM homework WHERE target_date < ?))
-                """,
-            (today,),
-        )
-        query = "DELETE FROM homework WHERE target_date < ?"
-        await self._execute(query, (today,))
+
+        async def job(db):
+            changes = db.total_changes
+            cursor = await db.execute(
+                """DELETE FROM homework WHERE id IN (
+                       SELECT id FROM homework WHERE target_date < ? LIMIT ?
+                   )""",
+                (today, batch_size),
+            )
+            return cursor.rowcount, db.total_changes - changes
+
+        removed = {"homework": 0, "rows": 0}
+        while True:
+            homework, rows = await self._write(job)
+            removed["homework"] += homework
+            removed["rows"] += rows
+            if homework:
+                self._after_commit(self._invalidate_feeds)
+            if homework < batch_size:
+                return removed
+
+    # --- Очистка осиротевших строк ---
+    async def _space_stats(self) -> Dict[str, int]:
+        stats = {}
+        for name in ("page_size", "page_count", "freelist_count"):
+            row = await self._execute(f"PRAGMA {name}", fetchone=True)
+            stats[name] = next(iter(row.values()))
+        return stats
+
+    async def sweep_orphans(self, batch_size: int = 500, vacuum: bool = False):
+        before = await self._space_stats()
+        removed = {}
+
+        for table, condition in ORPHANS:
+            query = f"""DELETE FROM {table} WHERE rowid IN (
+                            SELECT rowid FROM {table} WHERE {condition} LIMIT ?
+                        )"""
+
+            # Считаем и строки, удаленные каскадом вслед за сиротой
+            async def job(db, query=query):
+                changes = db.total_changes
+                cursor = await db.execute(query, (batch_size,))
+                return cursor.rowcount, db.total_changes - changes
+
+            removed[table] = 0
+            while True:
+                orphans, rows = await self._write(job)
+                removed[table] += rows
+                if orphans < batch_size:
+                    break
+
+        if vacuum:
+            await self._write(self._incremental_vacuum)
+
+        after = await self._space_stats()
+        page_size = after["page_size"]
+        used_before = before["page_count"] - before["freelist_count"]
+        used_after = after["page_count"] - after["freelist_count"]
+        return {
+            "removed": removed,
+            # Освобождено внутри файла базы (страницы ушли в freelist или из файла)
+            "freed_bytes": max(0, used_before - used_after) * page_size,
+            # На сколько уменьшился сам файл (только при vacuum=True)
+            "shrunk_bytes": max(0, before["page_count"] - after["page_count"])
+            * page_size,
+        }
+
+    @staticmethod
+    async def _incremental_vacuum(db: aiosqlite.Connection):
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        mode = (await cursor.fetchone())[0]
+        if mode != 2:
+            # Переключение в INCREMENTAL вступает в силу только после полного VACUUM
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+
+        cursor = await db.execute("PRAGMA incremental_vacuum")
+        await cursor.fetchall()
 
     async def add_homework(
         self,
@@ -234,13 +1093,92 @@ class Database:
             is_anonymous,
         )
         await self._execute(query, params)
+        self._after_commit(lambda: self._invalidate_class(grade, letter))
+
+    # --- Ленты классов: кэш на несколько секунд и общий запрос в полете ---
+    def _invalidate_class(self, grade, letter):
+        cls = (int(grade), letter)
+        self._feeds_generation[cls] += 1
+
+    def _invalidate_feeds(self):
+        for cls in self._feeds_generation:
+            self._feeds_generation[cls] += 1
+        self._feeds.clear()
+
+    # Параллельные вызовы с одним ключом ждут один и тот же запрос.
+    # Отмена одного из ждущих не отменяет запрос для остальных
+    async def _single_flight(self, key: Hashable, factory: Callable[[], Awaitable[Any]]):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+
+            def done(f):
+                self._inflight.pop(key, None)
+                if not f.cancelled():
+                    f.exception()
+
+            future.add_done_callback(done)
+
+        return await asyncio.shield(future)
+
+    # Страницы ленты идут по ключу (target_date, id): следующая страница
+    # начинается после последней показанной строки, без OFFSET.
+    # Кэшируется только первая страница - ее открывает почти каждый
+    async def _class_read(self, kind: str, grade, letter, query: str, after, limit):
+        today = datetime.now().strftime("%Y-%m-%d")
+        after_date, after_id = after or ("", 0)
+        params = (grade, letter, today, after_date, after_id, -1 if limit is None else limit)
+
+        uow = _current_uow.get()
+        if after is not None or (uow is not None and uow.runner is not None):
+            # Апдейт с незафиксированными записями читает мимо общего кэша
+            return await self._execute(query, params, fetch=True)
+
+        cls = (int(grade), letter)
+        key = (kind, cls, limit)
+        generation = self._feeds_generation[cls]
+        cached = self._feeds.get(key)
+        if cached is not MISSING and cached[:2] == (today, generation):
+            return [dict(row) for row in cached[2]]
+
+        rows = await self._single_flight(
+            key + (today, generation),
+            lambda: self._execute(query, params, fetch=True),
+        )
+        if generation == self._feeds_generation[cls]:
+            self._feeds.set(key, (today, generation, rows))
+        return [dict(row) for row in rows]
 
-    async def get_homework_by_class(self, grade, letter):
+    async def get_homework_by_class(
+        self, grade, letter, after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None
+    ):
         query = """SELECT h.*, s.name as subject_name FROM homework h
                    JOIN subjects s ON h.subject_id = s.id
-                   WHERE h.grade = ? AND h.letter = ?
-                   ORDER BY h.target_date ASC, h.created_at DESC"""
-        return await self._execute(query, (grade, letter), fetch=True)
+                   WHERE h.grade = ? AND h.letter = ? AND h.target_date >= ?
+                     AND (h.target_date, h.id) > (?, ?)
+                   ORDER BY h.target_date ASC, h.id ASC
+                   LIMIT ?"""
+        return await self._class_read("class", grade, letter, query, after, limit)
+
+    async def get_homework_feed(
+        self, grade, letter, after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None
+    ):
+        # Лента класса одним запросом: предмет, автор и число решений
+        query = """SELECT h.*, s.name AS subject_name,
+                          CASE WHEN h.is_anonymous THEN NULL
+                               ELSE u.first_name || ' ' || u.last_name
+                          END AS author_name,
+                          (SELECT COUNT(*) FROM solutions sol
+                           WHERE sol.homework_id = h.id) AS solution_count
+                   FROM homework h
+                   JOIN subjects s ON h.subject_id = s.id
+                   LEFT JOIN users u ON h.author_id = u.user_id
+                   WHERE h.grade = ? AND h.letter = ? AND h.target_date >= ?
+                     AND (h.target_date, h.id) > (?, ?)
+                   ORDER BY h.target_date ASC, h.id ASC
+                   LIMIT ?"""
+        return await self._class_read("feed", grade, letter, query, after, limit)
 
     async def get_homework_by_id(self, hw_id):
         return await self._execute(
@@ -248,17 +1186,106 @@ class Database:
         )
 
     # --- Работа с решениями ---
+    # None - задание уже удалено (например, истек срок), решение не сохранено
     async def add_solution(self, homework_id, author_id, text, is_anonymous):
         query = "INSERT INTO solutions (homework_id, author_id, text, is_anonymous) VALUES (?, ?, ?, ?)"
-        cursor = await self._execute(
-            query, (homework_id, author_id, text, is_anonymous)
+
+        async def job(db):
+            cursor = await db.execute(
+                "SELECT grade, letter FROM homework WHERE id = ?", (homework_id,)
+            )
+            hw = await cursor.fetchone()
+            if hw is None:
+                return None, None
+            cursor = await db.execute(query, (homework_id, author_id, text, is_anonymous))
+            sol_id = cursor.lastrowid
+            await db.execute(
+                "UPDATE homework SET version = version + 1 WHERE id = ?", (homework_id,)
+            )
+            return sol_id, hw
+
+        sol_id, hw = await self._write(job)
+        if hw is not None:
+            # В ленте класса изменилось число решений
+            grade, letter = hw["grade"], hw["letter"]
+            self._after_commit(lambda: self._invalidate_class(grade, letter))
+        return sol_id
+
+    # Решения идут по рейтингу (ups - downs) от лучших, при равенстве - по id.
+    # after - (рейтинг, id) последнего показанного решения
+    @staticmethod
+    def _solutions_page(hw_id, after: Optional[Tuple[int, int]], limit: Optional[int]):
+        if after is None:
+            return "s.homework_id = ?", (hw_id, -1 if limit is None else limit)
+
+        score, sol_id = after
+        condition = """s.homework_id = ? AND s.ups - s.downs <= ?
+                       AND (s.ups - s.downs < ? OR s.id > ?)"""
+        return condition, (hw_id, score, score, sol_id, -1 if limit is None else limit)
+
+    # Голоса, еще не сброшенные на диск, сразу видны в счетчиках. Версия
+    # растет на столько же, на сколько вырастет после сброса
+    def _pending_votes_for(self, sol_id: int) -> Tuple[int, int]:
+        ups, downs = self._pending_counters.get(sol_id, (0, 0))
+        if sol_id in self._flushing_counters:
+            flushing = self._flushing_counters[sol_id]
+            ups, downs = ups + flushing[0], downs + flushing[1]
+        return ups, downs
+
+    def _with_pending(self, sol: Dict[str, Any]) -> Dict[str, Any]:
+        if sol["id"] in self._pending_counters or sol["id"] in self._flushing_counters:
+            ups, downs = self._pending_votes_for(sol["id"])
+            sol["ups"] += ups
+            sol["downs"] += downs
+            sol["version"] += ups + downs
+        return sol
+
+    async def get_solutions(
+        self, hw_id, after: Optional[Tuple[int, int]] = None, limit: Optional[int] = None
+    ):
+        condition, params = self._solutions_page(hw_id, after, limit)
+        solutions = await self._execute(
+            f"""SELECT s.*, s.ups - s.downs AS score,
+                       CASE WHEN s.is_anonymous THEN NULL
+                            ELSE u.first_name || ' ' || u.last_name
+                       END AS author_name
+                FROM solutions s
+                LEFT JOIN users u ON s.author_id = u.user_id
+                WHERE {condition}
+                ORDER BY s.ups - s.downs DESC, s.id ASC
+                LIMIT ?""",
+            params,
+            fetch=True,
         )
-        return cursor.lastrowid
+        return [self._with_pending(sol) for sol in solutions]
 
-    async def get_solutions(self, hw_id):
-        return await self._execute(
-            "SELECT * FROM solutions WHERE homework_id = ?", (hw_id,), fetch=True
+    async def get_solutions_media(self, sol_ids) -> Dict[int, List[str]]:
+        media: Dict[int, List[str]] = {int(sol_id): [] for sol_id in sol_ids}
+        if not media:
+            return media
+
+        marks = ",".join("?" * len(media))
+        rows = await self._execute(
+            f"""SELECT parent_id, file_id FROM media
+                WHERE parent_id IN ({marks}) AND parent_type = 'solution'
+                ORDER BY id""",
+            tuple(media),
+            fetch=True,
         )
+        for row in rows:
+            media[row["parent_id"]].append(row["file_id"])
+        return media
+
+    async def get_solutions_bundle(
+        self, hw_id, after: Optional[Tuple[int, int]] = None, limit: Optional[int] = None
+    ):
+        # Страница решений с авторами, фото и голосами за два запроса,
+        # сколько бы решений ни было
+        solutions = await self.get_solutions(hw_id, after, limit)
+        media = await self.get_solutions_media(sol["id"] for sol in solutions)
+        for sol in solutions:
+            sol["media"] = media[sol["id"]]
+        return solutions
 
     async def check_solution_exists(self, hw_id):
         res = await self._execute(
@@ -280,44 +1307,141 @@ class Database:
         file_id: str,
     ):
         query = "INSERT INTO media (parent_id, parent_type, file_id) VALUES (?, 'solution', ?)"
-        await self._execute(
-            query,
-            (
-                solution_id,
-                file_id,
-            ),
-        )
+
+        async def job(db):
+            await db.execute(query, (solution_id, file_id))
+            await db.execute(
+                "UPDATE solutions SET version = version + 1 WHERE id = ?", (solution_id,)
+            )
+
+        await self._write(job)
+
+    # Все фото решения одним executemany; версия карточки растет один раз
+    async def add_solution_media_many(self, solution_id: int, file_ids: List[str]):
+        if not file_ids:
+            return
+        query = "INSERT INTO media (parent_id, parent_type, file_id) VALUES (?, 'solution', ?)"
+
+        async def job(db):
+            await db.executemany(query, [(solution_id, file_id) for file_id in file_ids])
+            await db.execute(
+                "UPDATE solutions SET version = version + 1 WHERE id = ?", (solution_id,)
+            )
+
+        await self._write(job)
 
     async def get_media(self, parent_id: int, parent_type: str):
-        query = "SELECT file_id FROM media WHERE parent_id = ?AND parent_type = ?"
+        query = "SELECT file_id FROM media WHERE parent_id = ? AND parent_type = ?"
         return await self._execute(query, (parent_id, parent_type), fetch=True)
 
     # --- Работа с голосами ---
+    # Голос, счетчик решения и репутация автора меняются в одной транзакции
+    # True - голос учтен, False - пользователь уже голосовал,
+    # None - решения больше нет
     async def add_vote(self, user_id, sol_id, vote_value):
-        try:
-            await self._execute(
+        if self.write_behind:
+            return await self._add_vote_deferred(int(user_id), int(sol_id), vote_value)
+
+        column = "ups" if vote_value > 0 else "downs"
+
+        async def job(db):
+            cursor = await db.execute(
+                "SELECT author_id FROM solutions WHERE id = ?", (sol_id,)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            await db.execute(
                 "INSERT INTO votes (user_id, solution_id, vote_value) VALUES (?, ?, ?)",
                 (user_id, sol_id, vote_value),
             )
-            return True
-        except:
+            await db.execute(
+                f"UPDATE solutions SET {column} = {column} + 1, version = version + 1 WHERE id = ?",
+                (sol_id,),
+            )
+            await self._apply_reputation(db, row["author_id"], vote_value, "vote")
+            return row
+
+        try:
+            row = await self._write(job)
+        except sqlite3.IntegrityError:
+            # Решение на месте (проверено выше), значит голос уже есть
             return False
 
-    async def get_solution_votes(self, sol_id):
-        query = """
-            SELECT
-                SUM(CASE WHEN vote_value = 1 THEN 1 ELSE 0 END) as ups,
-                SUM(CASE WHEN vote_value = -1 THEN 1 ELSE 0 END) as downs
-            FROM votes
-            WHERE solution_id = ?
-        """
-        res = await self._execute(query, (sol_id,), fetchone=True)
+        if row is None:
+            return None
+        self._user_changed(row["author_id"], reputation=vote_value)
+        return True
 
-        ups = res["ups"] if res and res["ups"] else 0
-        downs = res["downs"] if res and res["downs"] else 0
+    async def _add_vote_deferred(self, user_id, sol_id, vote_value):
+        key = (user_id, sol_id)
+        if key in self._pending_votes or key in self._flushing_votes:
+            return False
+        row = await self._execute(
+            """SELECT EXISTS (SELECT 1 FROM votes WHERE user_id = ? AND solution_id = ?) AS voted
+               FROM solutions WHERE id = ?""",
+            (user_id, sol_id, sol_id),
+            fetchone=True,
+        )
+        if row is None:
+            return None
+        # Пока шел запрос, такой же голос мог попасть в буфер
+        if row["voted"] or key in self._pending_votes or key in self._flushing_votes:
+            return False
+
+        def buffer():
+            # Параллельный апдейт мог успеть зафиксировать такой же голос
+            if key in self._pending_votes or key in self._flushing_votes:
+                return
+            self._pending_votes[key] = vote_value
+            self._pending_counters[sol_id][0 if vote_value > 0 else 1] += 1
+            self._buffered()
+
+        self._after_commit(buffer)
+        return True
 
+    async def get_solution_votes(self, sol_id):
+        res = await self._execute(
+            "SELECT ups, downs FROM solutions WHERE id = ?", (sol_id,), fetchone=True
+        )
+        if not res:
+            return 0, 0
+        ups, downs = res["ups"], res["downs"]
+        if self._pending_votes or self._flushing_votes:
+            ups_pending, downs_pending = self._pending_votes_for(int(sol_id))
+            ups, downs = ups + ups_pending, downs + downs_pending
         return ups, downs
 
+    # Сверка счетчиков ups/downs с таблицей votes; fix=True исправляет расхождения
+    async def check_vote_counters(self, fix: bool = False):
+        mismatches = await self._execute(
+            """SELECT s.id, s.ups, s.downs,
+                      COALESCE(v.ups, 0) AS real_ups,
+                      COALESCE(v.downs, 0) AS real_downs
+               FROM solutions s
+               LEFT JOIN (
+                   SELECT solution_id,
+                          SUM(CASE WHEN vote_value = 1 THEN 1 ELSE 0 END) AS ups,
+                          SUM(CASE WHEN vote_value = -1 THEN 1 ELSE 0 END) AS downs
+                   FROM votes
+                   GROUP BY solution_id
+               ) v ON v.solution_id = s.id
+               WHERE s.ups != COALESCE(v.ups, 0) OR s.downs != COALESCE(v.downs, 0)""",
+            fetch=True,
+        )
+
+        if fix and mismatches:
+
+            async def job(db):
+                await db.executemany(
+                    "UPDATE solutions SET ups = ?, downs = ?, version = version + 1 WHERE id = ?",
+                    [(m["real_ups"], m["real_downs"], m["id"]) for m in mismatches],
+                )
+
+            await self._write(job)
+
+        return mismatches
+
     async def add_report(
         self,
         reporter_id: int,
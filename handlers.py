@@ -1,19 +1,42 @@
-from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, InputMediaPhoto
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import SendMessage
 from datetime import datetime
 from dotenv import load_dotenv
+from typing import List, Optional
 import os
 import re
 
+from callbacks import (
+    CallbackRouter,
+    ChangeCallback,
+    DateCallback,
+    HomeworkPageCallback,
+    ReportCallback,
+    SolutionPageCallback,
+    SolveCallback,
+    TopCallback,
+    ViewCallback,
+    VoteCallback,
+)
+from cards import card_method, cached_solution_cards, homework_card, solution_cards
 from database import Database
+from middlewares import ACTIVE, ADMIN, REGISTERED
+from sender import BULK, Sender
 from states import *
 from keyboards import *
 
 load_dotenv()
 
 router = Router()
+# Все нажатия на inline-кнопки идут через одну таблицу префиксов
+callbacks = CallbackRouter()
+router.callback_query.register(callbacks.dispatch)
+# Сколько карточек отправляется за одно нажатие
+HOMEWORK_PAGE_SIZE = 5
+SOLUTIONS_PAGE_SIZE = 3
 SUPER_ADMIN_ID = int(os.getenv("SUPER_ADMIN_ID"))
 
 if SUPER_ADMIN_ID is None:
@@ -37,9 +60,7 @@ async def cmd_cancel(message: Message, state: FSMContext):
 
 
 @router.message(Command("help"))
-async def cmd_help(message: Message, db: Database):
-    user = await db.get_user(message.from_user.id)
-
+async def cmd_help(message: Message, user: Optional[dict]):
     help_text = [
         "<b>📚 Доступные команды:</b>",
         "/start - Перезапустить бота",
@@ -69,11 +90,7 @@ async def cmd_help(message: Message, db: Database):
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext, db: Database):
-    if not message.from_user:
-        return
-    user = await db.get_user(message.from_user.id)
-
+async def cmd_start(message: Message, state: FSMContext, user: Optional[dict]):
     if user:
         await message.answer(
             f"Ты уже зарегистрирован. Твой класс: {user['grade']}-{user['letter']}",
@@ -174,6 +191,9 @@ async def name_chosen(message: Message, state: FSMContext, db: Database):
         grade=data["chosen_grade"],
         letter=data["chosen_letter"],
     )
+    # Фиксируем до ответа: писатель базы не ждет Telegram, а ошибка
+    # отправки не откатывает регистрацию
+    await db.commit()
 
     await message.answer(
         f"Приятно познакомиться, {first_name}! Регистрация завершена. 🎉. Выбирай действие:",
@@ -182,19 +202,9 @@ async def name_chosen(message: Message, state: FSMContext, db: Database):
     await state.clear()
 
 
-@router.message(Command("profile"))
-@router.message(F.text == "👤 Профиль")
-async def show_profile(message: Message, db: Database):
-    if not message.from_user:
-        return
-    user = await db.get_user(message.from_user.id)
-
-    if not user:
-        await message.answer(
-            "<b>Упс!</b> Похоже, ты еще не зарегистрирован.\nДля регистрации напиши /start"
-        )
-        return
-
+@router.message(Command("profile"), flags={"access": REGISTERED})
+@router.message(F.text == "👤 Профиль", flags={"access": REGISTERED})
+async def show_profile(message: Message, db: Database, user: dict):
     reputation = user["reputation"]
     if reputation < 50:
         rank = "Новичок 👶"
@@ -209,6 +219,14 @@ async def show_profile(message: Message, db: Database):
     else:
         status = ""
 
+    school_rank, class_rank = await db.get_user_rank(user["user_id"])
+    places = ""
+    if school_rank and class_rank:
+        places = (
+            f"📊 <b>Место в школе:</b> {school_rank[0]} из {school_rank[1]}\n"
+            f"📊 <b>Место в классе:</b> {class_rank[0]} из {class_rank[1]}\n"
+        )
+
     text = (
         f"👤 <b>Твой профиль</b>\n"
         f"━━━━━━━━━━━━━━\n"
@@ -216,7 +234,8 @@ async def show_profile(message: Message, db: Database):
         f"🏫 <b>Класс:</b> {user['grade']}-{user['letter']}\n"
         f"🌟 <b>Репутация:</b> <code>{user['reputation']}</code>\n"
         f"🆔 <b>ID:</b> <code>{user['user_id']}</code>\n"
-        f"🏆 <b>Ранг:</b> {rank}\n\n"
+        f"🏆 <b>Ранг:</b> {rank}\n"
+        f"{places}\n"
         f"<i>Статус: {'Администратор' if user['is_admin'] else 'Ученик'}</i>"
         f" <i>{status}</i>\n\n"
         f"<i>Изменить профиль можно через настройки /settings</i>"
@@ -233,7 +252,7 @@ async def show_settings(message: Message):
     )
 
 
-@router.callback_query(F.data == "change_grade")
+@callbacks.route(ChangeCallback, kind="grade")
 async def start_change_class(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
         "Введи свой новый класс и букву (например, 10-А):", reply_markup=get_cancel_kb()
@@ -253,12 +272,13 @@ async def process_change_grade(message: Message, state: FSMContext, db: Database
     grade, letter = match.groups()
 
     await db.update_user_grade(message.from_user.id, int(grade), letter.upper())
+    await db.commit()
 
     await message.answer(f"✅ Готово! Теперь твой класс: {grade}-{letter.upper()}")
     await state.clear()
 
 
-@router.callback_query(F.data == "change_name")
+@callbacks.route(ChangeCallback, kind="name")
 async def start_change_name(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("Введи новое имя:", reply_markup=get_cancel_kb())
     await state.set_state(SettingsStates.waiting_for_new_name)
@@ -280,24 +300,14 @@ async def process_change_name(message: Message, state: FSMContext, db: Database)
     last_name = "".join(names[1:][:20])
 
     await db.update_user_name(message.from_user.id, first_name, last_name)
+    await db.commit()
 
     await message.answer(f"✅ Готово! Теперь твое имя: {first_name} {last_name}")
     await state.clear()
 
 
-@router.message(F.text == "➕ Добавить ДЗ")
+@router.message(F.text == "➕ Добавить ДЗ", flags={"access": ACTIVE})
 async def start_add_hw(message: Message, state: FSMContext, db: Database):
-    user = await db.get_user(message.from_user.id)
-    if not user:
-        await message.answer(
-            "<b>Упс!</b> Похоже, ты еще не зарегистрирован.\nДля регистрации напиши /start"
-        )
-        return
-
-    if user.get("is_banned"):
-        await message.answer("⛔ Вы заблокированы администрацией.")
-        return
-
     subjects = await db.get_subjects()
     await message.answer(
         "<b>Выберите предмет:</b>", reply_markup=get_subjects_kb(subjects)
@@ -338,11 +348,13 @@ async def photo_added(message: Message, state: FSMContext):
     await state.set_state(AddHomework.waiting_for_date)
 
 
-@router.callback_query(F.data.startswith("date_"))
-async def data_adding(callback: CallbackQuery, state: FSMContext):
-    if not callback.message or not callback.data:
+@callbacks.route(DateCallback)
+async def data_adding(
+    callback: CallbackQuery, callback_data: DateCallback, state: FSMContext
+):
+    if not callback.message:
         return
-    selected_date = callback.data.replace("date_", "")
+    selected_date = callback_data.day
 
     if selected_date == "manual":
         await callback.message.answer("Введите дату в формате ДД.ММ (например, 18.01):")
@@ -384,14 +396,12 @@ async def manual_data_adding(message: Message, state: FSMContext):
 
 
 @router.message(
-    AddHomework.waiting_for_anon, F.text.in_(["Анонимно", "От своего имени"])
+    AddHomework.waiting_for_anon,
+    F.text.in_(["Анонимно", "От своего имени"]),
+    flags={"access": ACTIVE},
 )
-async def save_homework(message: Message, state: FSMContext, db: Database):
-    if not message.from_user:
-        return
-
+async def save_homework(message: Message, state: FSMContext, db: Database, user: dict):
     data = await state.get_data()
-    user = await db.get_user(message.from_user.id)
 
     subject = await db.get_subject_by_name(data["subject_name"])
     if not subject:
@@ -408,6 +418,7 @@ async def save_homework(message: Message, state: FSMContext, db: Database):
         author_id=message.from_user.id,
         is_anonymous=is_anon,
     )
+    await db.commit()
 
     await message.answer(
         "✅ <b>Задание успешно добавлено!</b>", reply_markup=get_main_menu_kb()
@@ -415,61 +426,71 @@ async def save_homework(message: Message, state: FSMContext, db: Database):
     await state.clear()
 
 
-@router.message(F.text == "📚 Узнать ДЗ")
-async def show_homework(message: Message, db: Database):
-    await db.delete_expired_homework()
-    if not message.from_user:
-        return
-
-    user = await db.get_user(message.from_user.id)
-    if not user:
-        await message.answer(
-            "<b>Упс!</b> Похоже, ты еще не зарегистрирован.\nДля регистрации напиши /start"
-        )
-        return
-
-    homeworks = await db.get_homework_by_class(user["grade"], user["letter"])
+@router.message(F.text == "📚 Узнать ДЗ", flags={"access": REGISTERED})
+async def show_homework(message: Message, db: Database, sender: Sender, user: dict):
+    homeworks = await db.get_homework_feed(
+        user["grade"], user["letter"], limit=HOMEWORK_PAGE_SIZE + 1
+    )
 
     if not homeworks:
         await message.answer("<b>Новых заданий нет!</b> 🎉")
         return
 
-    for hw in homeworks:
-        has_sol = await db.check_solution_exists(hw["id"])
+    await send_homework_page(message, sender, homeworks)
 
-        date_str = hw["target_date"]
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        display_date = date_obj.strftime("%d.%m")
 
-        if hw["is_anonymous"]:
-            author_name = "Анонимно"
-        else:
-            author_data = await db.get_user(hw["author_id"])
-            if author_data:
-                author_name = f"{author_data['first_name']} {author_data['last_name']}"
-
-        text = (
-            f"📌 <b>Предмет:</b> {hw['subject_name']}\n"
-            f"📝 <b>Задание:</b> {hw['text']}\n"
-            f"⏳ <b>День:</b> {display_date}\n"
-            f"👤 <b>Автор:</b> {author_name}"
-        )
+@callbacks.route(HomeworkPageCallback, access=REGISTERED)
+async def show_homework_page(
+    callback: CallbackQuery,
+    callback_data: HomeworkPageCallback,
+    db: Database,
+    sender: Sender,
+    user: dict,
+):
+    homeworks = await db.get_homework_feed(
+        user["grade"],
+        user["letter"],
+        after=(callback_data.target_date, callback_data.hw_id),
+        limit=HOMEWORK_PAGE_SIZE + 1,
+    )
 
-        if hw["photo_id"]:
-            await message.answer_photo(
-                hw["photo_id"],
-                caption=text,
-                reply_markup=get_hw_actions_kb(hw["id"], has_sol),
-            )
-        else:
-            await message.answer(
-                text, reply_markup=get_hw_actions_kb(hw["id"], has_sol)
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
+
+    if not homeworks:
+        await callback.answer("Больше заданий нет.")
+        return
+
+    await callback.answer()
+    await send_homework_page(callback.message, sender, homeworks)
+
+
+# Запрашивается на одну строку больше страницы: так видно, есть ли продолжение.
+# Страница целиком строится в памяти и уходит через планировщик отправки
+async def send_homework_page(message: Message, sender: Sender, homeworks):
+    has_more = len(homeworks) > HOMEWORK_PAGE_SIZE
+    homeworks = homeworks[:HOMEWORK_PAGE_SIZE]
+
+    methods = [card_method(message, homework_card(hw)) for hw in homeworks]
+    if has_more:
+        last = homeworks[-1]
+        methods.append(
+            message.answer(
+                "Это не все задания.",
+                reply_markup=get_more_homework_kb(last["target_date"], last["id"]),
             )
+        )
+
+    await sender.send_many(methods)
 
 
-@router.callback_query(F.data.startswith("report_hw"))
-async def handle_hw_report(callback: CallbackQuery, db: Database, bot: Bot):
-    hw_id = int(callback.data.replace("report_hw_", ""))
+@callbacks.route(ReportCallback, kind="hw")
+async def handle_hw_report(
+    callback: CallbackQuery, callback_data: ReportCallback, db: Database, sender: Sender
+):
+    hw_id = callback_data.target_id
     reporter_id = callback.from_user.id
 
     hw = await db.get_homework_by_id(hw_id)
@@ -489,37 +510,30 @@ async def handle_hw_report(callback: CallbackQuery, db: Database, bot: Bot):
         reason=reason,
     )
 
-    await bot.send_message(
-        SUPER_ADMIN_ID,
-        f"⚠️ <b>Жалоба на <i>задание</i>!</b>\n"
-        f"ID домашнего задания: <code>{hw_id}</code>\n"
-        f"Отправитель: {callback.from_user.id}\n"
-        f"На кого жалоба: {hw['author_id']}\n"
-        f"Текст жалобы:\n<blockquote>{reason}</blockquote>\n"
-        f"Используй /ban <code>{hw['author_id']}</code> или /del_sol <code>{hw_id}</code>",
-        parse_mode="HTML",
+    # Уведомление модератору не ждем: апдейт не держит транзакцию ради рассылки
+    sender.submit(
+        SendMessage(
+            chat_id=SUPER_ADMIN_ID,
+            text=f"⚠️ <b>Жалоба на <i>задание</i>!</b>\n"
+                f"ID домашнего задания: <code>{hw_id}</code>\n"
+                f"Отправитель: {callback.from_user.id}\n"
+                f"На кого жалоба: {hw['author_id']}\n"
+                f"Текст жалобы:\n<blockquote>{reason}</blockquote>\n"
+                f"Используй /ban <code>{hw['author_id']}</code> или /del_sol <code>{hw_id}</code>",
+            parse_mode="HTML",
+        ),
+        priority=BULK,
     )
 
 
-@router.callback_query(F.data.startswith("solve_"))
-async def handle_solve_button(callback: CallbackQuery, state: FSMContext, db: Database):
-    if not callback.data or not callback.message:
-        return
-    user = await db.get_user(callback.from_user.id)
-
-    if not user:
-        await callback.answer("❌ Сначала зарегистрируйтесь в боте!", show_alert=True)
-        return
-
-    if user.get("is_banned"):
-        await callback.answer(
-            "⛔ Вы забанены из-за нарушений. Вы в режиме 'Только чтение'",
-            show_alert=True,
-        )
+@callbacks.route(SolveCallback, access=ACTIVE)
+async def handle_solve_button(
+    callback: CallbackQuery, callback_data: SolveCallback, state: FSMContext
+):
+    if not callback.message:
         return
 
-    hw_id = callback.data.split("_")[1]
-    await state.update_data(hw_id=hw_id)
+    await state.update_data(hw_id=callback_data.hw_id)
 
     await callback.message.answer(
         "Отлично! Пришли текст решения или фото:", reply_markup=get_cancel_kb()
@@ -542,20 +556,27 @@ async def solution_content_completly_added(message: Message, state: FSMContext):
     await state.set_state(AddSolution.waiting_for_anon)
 
 
-@router.message(AddSolution.waiting_for_content)
-async def solution_content_adding(message: Message, state: FSMContext):
+# Альбом приходит сюда целиком (flags album): все фото одним изменением
+# состояния и одним ответом
+@router.message(AddSolution.waiting_for_content, flags={"album": True})
+async def solution_content_adding(
+    message: Message, state: FSMContext, album: Optional[List[Message]] = None
+):
     data = await state.get_data()
 
     photos = data.get("sol_photos", [])
+    changes = {}
 
-    if message.photo:
-        photos.append(message.photo[-1].file_id)
-        if message.caption:
-            await state.update_data(sol_text=message.caption)
-    elif message.text:
-        await state.update_data(sol_text=message.text)
+    for part in album or [message]:
+        if part.photo:
+            photos = [*photos, part.photo[-1].file_id]
+            changes["sol_photos"] = photos
+            if part.caption:
+                changes["sol_text"] = part.caption
+        elif part.text:
+            changes["sol_text"] = part.text
 
-    await state.update_data(sol_photos=photos)
+    await state.update_data(changes)
 
     await message.answer(
         f"Фото добавлено (всего: {len(photos)}). Пришлите еще или нажмите 'Готово ✅'",
@@ -564,12 +585,11 @@ async def solution_content_adding(message: Message, state: FSMContext):
 
 
 @router.message(
-    AddSolution.waiting_for_anon, F.text.in_(["Анонимно", "От своего имени"])
+    AddSolution.waiting_for_anon,
+    F.text.in_(["Анонимно", "От своего имени"]),
+    flags={"access": ACTIVE},
 )
 async def publish_solution(message: Message, state: FSMContext, db: Database):
-    if not message.from_user:
-        return
-
     data = await state.get_data()
     is_anon = 1 if message.text == "Анонимно" else 0
 
@@ -579,79 +599,113 @@ async def publish_solution(message: Message, state: FSMContext, db: Database):
         text=data.get("sol_text"),
         is_anonymous=is_anon,
     )
+    if sol_id is None:
+        # Пока писалось решение, задание истекло и было удалено
+        await state.clear()
+        await message.answer(
+            "❌ Задание уже удалено, решение не сохранено.", reply_markup=get_main_menu_kb()
+        )
+        return
 
-    photos = data.get("sol_photos", [])
-    for f_id in photos:
-        await db.add_solution_media(sol_id, f_id)
+    await db.add_solution_media_many(sol_id, data.get("sol_photos", []))
+
+    await db.update_reputation(message.from_user.id, 5, reason="solution")
+    # Решение, фото и баллы фиксируются вместе, до ответа пользователю
+    await db.commit()
 
     await message.answer(
         "✅ Решение успешно опубликовано!", reply_markup=get_main_menu_kb()
     )
-    await db.update_reputation(message.from_user.id, 5)
 
     await state.clear()
 
 
-@router.callback_query(F.data.startswith("view_"))
-async def view_solutions(callback: CallbackQuery, db: Database):
-    hw_id = callback.data.split("_")[1]
-    solutions = await db.get_solutions(hw_id)
+@callbacks.route(ViewCallback)
+async def view_solutions(
+    callback: CallbackQuery, callback_data: ViewCallback, db: Database, sender: Sender
+):
+    hw_id = callback_data.hw_id
+    solutions = await db.get_solutions(hw_id, limit=SOLUTIONS_PAGE_SIZE + 1)
 
     if not solutions:
         await callback.answer("Решений пока нет.", show_alert=True)
         return
 
-    await callback.answer(f"🔎 Найдено решений: {len(solutions)}")
+    await callback.answer("🔎 Лучшие решения")
+    await send_solutions_page(callback.message, db, sender, hw_id, solutions)
 
-    for sol in solutions:
-        author_text = "Анонимно"
-        if not sol["is_anonymous"]:
-            user = await db.get_user(sol["author_id"])
-            if user:
-                author_text = f"{user['first_name']} {user['last_name']}"
 
-        caption_text = f"✅ <b>Решение от:</b> {author_text}\n\n{sol['text'] or '<i>(Без текста)</i>'}"
-
-        media_files = await db.get_media(sol["id"], "solution")
+@callbacks.route(SolutionPageCallback)
+async def view_solutions_page(
+    callback: CallbackQuery,
+    callback_data: SolutionPageCallback,
+    db: Database,
+    sender: Sender,
+):
+    hw_id = callback_data.hw_id
+    solutions = await db.get_solutions(
+        hw_id,
+        after=(callback_data.score, callback_data.sol_id),
+        limit=SOLUTIONS_PAGE_SIZE + 1,
+    )
 
-        ups, downs = await db.get_solution_votes(sol["id"])
-        kb = get_solution_votes_kb(sol["id"], ups, downs)
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
 
-        if media_files:
-            media_group = []
-            for i, file_rec in enumerate(media_files):
-                if i == 0:
-                    media_group.append(
-                        InputMediaPhoto(media=file_rec["file_id"], caption=caption_text)
-                    )
-                else:
-                    media_group.append(InputMediaPhoto(media=file_rec["file_id"]))
+    if not solutions:
+        await callback.answer("Больше решений нет.")
+        return
 
-            await callback.message.answer_media_group(media_group)
-            await callback.message.answer("Оцените решение: 👆", reply_markup=kb)
+    await callback.answer()
+    await send_solutions_page(callback.message, db, sender, hw_id, solutions)
+
+
+# Фото догружаются только для решений, чьих карточек нет в кэше
+async def send_solutions_page(
+    message: Message, db: Database, sender: Sender, hw_id, solutions
+):
+    has_more = len(solutions) > SOLUTIONS_PAGE_SIZE
+    solutions = solutions[:SOLUTIONS_PAGE_SIZE]
+
+    cards = {sol["id"]: cached_solution_cards(sol) for sol in solutions}
+    missing = [sol for sol in solutions if cards[sol["id"]] is None]
+    if missing:
+        media = await db.get_solutions_media(sol["id"] for sol in missing)
+        for sol in missing:
+            sol["media"] = media[sol["id"]]
+            cards[sol["id"]] = solution_cards(sol)
+
+    methods = [
+        card_method(message, card) for sol in solutions for card in cards[sol["id"]]
+    ]
+    if has_more:
+        # Ключ страницы - рейтинг из базы, без учета еще не сброшенных голосов
+        last = solutions[-1]
+        methods.append(
+            message.answer(
+                "Это не все решения.",
+                reply_markup=get_more_solutions_kb(hw_id, last["score"], last["id"]),
+            )
+        )
 
-        else:
-            await callback.message.answer(caption_text, reply_markup=kb)
+    await sender.send_many(methods)
 
 
-@router.callback_query(F.data.startswith("vote_"))
-async def handle_vote(callback: CallbackQuery, db: Database):
-    user = await db.get_user(callback.from_user.id)
+@callbacks.route(VoteCallback, access=ACTIVE)
+async def handle_vote(callback: CallbackQuery, callback_data: VoteCallback, db: Database):
+    action = callback_data.action
+    sol_id = callback_data.sol_id
+    user_id = callback.from_user.id
 
-    if user.get("is_banned"):
+    solution = await db.get_solution_by_id(sol_id)
+    if solution is None:
         await callback.answer(
-            "⛔ Вы забанены из-за нарушений. Вы не можете голосовать",
-            show_alert=True,
+            "Ошибка: решение не найдено. Возможно его уже удалили.", show_alert=True
         )
         return
 
-    parts = callback.data.split("_")
-    action = parts[1]
-    sol_id = parts[2]
-    user_id = callback.from_user.id
-
-    solution = await db.get_solution_by_id(sol_id)
-
     if solution["author_id"] == user_id:
         await callback.answer("Нельзя голосовать за свое решение!", show_alert=True)
         return
@@ -659,14 +713,18 @@ async def handle_vote(callback: CallbackQuery, db: Database):
     vote_value = 1 if action == "up" else -1
 
     success = await db.add_vote(user_id, sol_id, vote_value)
+    await db.commit()
+    if success is None:
+        await callback.answer(
+            "Ошибка: решение не найдено. Возможно его уже удалили.", show_alert=True
+        )
+        return
     if not success:
         await callback.message.answer(
             "Вы уже голосовали за это решение!", show_alert=True
         )
         return
 
-    await db.update_reputation(solution["author_id"], vote_value)
-
     ups, downs = await db.get_solution_votes(sol_id)
 
     new_kb = get_solution_votes_kb(sol_id, ups, downs)
@@ -679,9 +737,11 @@ async def handle_vote(callback: CallbackQuery, db: Database):
     await callback.answer("Голос учтен!")
 
 
-@router.callback_query(F.data.startswith("report_sol"))
-async def handle_hw_report(callback: CallbackQuery, db: Database, bot: Bot):
-    sol_id = int(callback.data.replace("report_sol_", ""))
+@callbacks.route(ReportCallback, kind="sol")
+async def handle_sol_report(
+    callback: CallbackQuery, callback_data: ReportCallback, db: Database, sender: Sender
+):
+    sol_id = callback_data.target_id
     reporter_id = callback.from_user.id
 
     sol = await db.get_solution_by_id(sol_id)
@@ -703,27 +763,24 @@ async def handle_hw_report(callback: CallbackQuery, db: Database, bot: Bot):
         reason=reason,
     )
 
-    await bot.send_message(
-        SUPER_ADMIN_ID,
-        f"⚠️ <b>Жалоба на <i>решение</i>!</b>\n"
-        f"ID домашнего задания: <code>{sol_id}</code>\n"
-        f"Отправитель: {callback.from_user.id}\n"
-        f"На кого жалоба: {sol['author_id']}\n"
-        f"Текст жалобы:\n<blockquote>{reason}</blockquote>\n"
-        f"Используй /ban <code>{sol['author_id']}</code> или /del_sol <code>{sol_id}</code>",
-        parse_mode="HTML",
+    # Уведомление модератору не ждем: апдейт не держит транзакцию ради рассылки
+    sender.submit(
+        SendMessage(
+            chat_id=SUPER_ADMIN_ID,
+            text=f"⚠️ <b>Жалоба на <i>решение</i>!</b>\n"
+                f"ID домашнего задания: <code>{sol_id}</code>\n"
+                f"Отправитель: {callback.from_user.id}\n"
+                f"На кого жалоба: {sol['author_id']}\n"
+                f"Текст жалобы:\n<blockquote>{reason}</blockquote>\n"
+                f"Используй /ban <code>{sol['author_id']}</code> или /del_sol <code>{sol_id}</code>",
+            parse_mode="HTML",
+        ),
+        priority=BULK,
     )
 
 
-@router.message(F.text == "🏆 Топ учеников")
-async def show_top_users(message: Message, db: Database):
-    top_users = await db.get_top_users(5)
-
-    if not top_users:
-        await message.answer("Список лидеров пока пуст.")
-        return
-
-    text = "<b>🏆 Топ-5 активных учеников:</b>\n\n"
+def format_top_users(title, top_users):
+    text = f"<b>{title}</b>\n\n"
 
     medals = ["🥇", "🥈", "🥉"]
 
@@ -734,18 +791,42 @@ async def show_top_users(message: Message, db: Database):
             f"({user['grade']}-{user['letter']}) — <b>{user['reputation']}</b> ⭐\n"
         )
 
-    await message.answer(text)
+    return text
 
 
-@router.message(F.text == "👥 Мой класс")
-async def show_class_stats(message: Message, db: Database):
-    user = await db.get_user(message.from_user.id)
-    if not user:
-        await message.answer(
-            "<b>Упс!</b> Похоже, ты еще не зарегистрирован.\nДля регистрации напиши /start"
-        )
+@router.message(F.text == "🏆 Топ учеников")
+async def show_top_users(message: Message, db: Database):
+    top_users = await db.get_top_users(5)
+
+    if not top_users:
+        await message.answer("Список лидеров пока пуст.")
+        return
+
+    await message.answer(
+        format_top_users("🏆 Топ-5 активных учеников:", top_users),
+        reply_markup=get_top_period_kb(),
+    )
+
+
+@callbacks.route(TopCallback)
+async def show_period_top(callback: CallbackQuery, callback_data: TopCallback, db: Database):
+    if callback_data.period == "week":
+        days, title = 7, "📅 Топ-5 за неделю:"
+    else:
+        days, title = 30, "🗓 Топ-5 за месяц:"
+
+    top_users = await db.get_top_users_for_period(days, 5)
+
+    if not top_users:
+        await callback.answer("За этот период баллов еще никто не набрал.", show_alert=True)
         return
 
+    await callback.message.answer(format_top_users(title, top_users))
+    await callback.answer()
+
+
+@router.message(F.text == "👥 Мой класс", flags={"access": REGISTERED})
+async def show_class_stats(message: Message, db: Database, user: dict):
     students = await db.get_class_users(user["grade"], user["letter"])
 
     text = f"📊 <b>Статистика класса {user['grade']}-{user['letter']}:</b>\n\n"
@@ -763,20 +844,14 @@ async def show_class_stats(message: Message, db: Database):
     await message.answer(text)
 
 
-@router.message(Command("ban"))
-async def start_ban_user(message: Message, state: FSMContext, db: Database):
-    user = await db.get_user(message.from_user.id)
-
-    if user["is_admin"] == 0:
-        await message.answer("❌ У вас нет прав админа.")
-        return
-
+@router.message(Command("ban"), flags={"access": ADMIN})
+async def start_ban_user(message: Message, state: FSMContext):
     await message.answer("Введи ID пользователя для <b>БАНА</b>:")
 
     await state.set_state(BanUser.waiting_for_ban_id)
 
 
-@router.message(BanUser.waiting_for_ban_id)
+@router.message(BanUser.waiting_for_ban_id, flags={"access": ADMIN})
 async def process_ban_user(message: Message, state: FSMContext, db: Database):
     if not message.text.isdigit():
         await message.answer("ID должен состоять только из цифр. Попробуй еще раз.")
@@ -795,6 +870,7 @@ async def process_ban_user(message: Message, state: FSMContext, db: Database):
         return
 
     await db.ban_user(int(message.text))
+    await db.commit()
 
     await message.answer(
         f"⛔ Пользователь <code>{message.text}</code> успешно <b>ЗАБАНЕН</b>!",
@@ -803,25 +879,20 @@ async def process_ban_user(message: Message, state: FSMContext, db: Database):
     await state.clear()
 
 
-@router.message(Command("unban"))
-async def start_unban_user(message: Message, state: FSMContext, db: Database):
-    user = await db.get_user(message.from_user.id)
-
-    if user["is_admin"] == 0:
-        await message.answer("❌ У вас нет прав админа.")
-        return
-
+@router.message(Command("unban"), flags={"access": ADMIN})
+async def start_unban_user(message: Message, state: FSMContext):
     await message.answer("Введи ID пользователя для <b>РАЗБАНА</b>:")
     await state.set_state(BanUser.waiting_for_unban_id)
 
 
-@router.message(BanUser.waiting_for_unban_id)
+@router.message(BanUser.waiting_for_unban_id, flags={"access": ADMIN})
 async def process_unban_user(message: Message, state: FSMContext, db: Database):
     if not message.text.isdigit():
         await message.answer("ID должен состоять только из цифр.")
         return
 
     await db.unban_user(int(message.text))
+    await db.commit()
 
     await message.answer(
         f"✅ Пользователь <code>{message.text}</code> успешно <b>РАЗБАНЕН</b>!",
@@ -865,6 +936,7 @@ async def set_admin_status(message: Message, state: FSMContext, db: Database):
 
     status = int(message.text)
     await db.set_admin_status(user_id=data["id"], status=status)
+    await db.commit()
     text = f"✅ Пользователь <code>{data['id']}</code> {"теперь" if status == 1 else "больше не"} администратор!"
     await message.answer(text, reply_markup=get_main_menu_kb())
     await state.clear()
@@ -2,90 +2,189 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+from callbacks import (
+    ChangeCallback,
+    DateCallback,
+    HomeworkPageCallback,
+    ReportCallback,
+    SolutionPageCallback,
+    SolveCallback,
+    TopCallback,
+    ViewCallback,
+    VoteCallback,
+)
+
+# --- Статичные клавиатуры ---
+# Каждая клавиатура собирается один раз при импорте, и все ответы получают
+# один и тот же объект. Разметка aiogram изменяемая (frozen=False): правка
+# кнопок или строк у полученной клавиатуры останется в ней для всех
+# следующих ответов. Поэтому результат get_*_kb нельзя менять - для
+# другой клавиатуры нужно собрать новую разметку
+_CONFIRM_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="✅ Да, верно"), KeyboardButton(text="❌ Нет")]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+_GRADE_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="8"),
+            KeyboardButton(text="9"),
+            KeyboardButton(text="10"),
+            KeyboardButton(text="11"),
+        ]
+    ],
+    resize_keyboard=True,
+)
+
+_LETTER_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="Т"),
+            KeyboardButton(text="М"),
+            KeyboardButton(text="Э"),
+        ],
+        [
+            KeyboardButton(text="А"),
+            KeyboardButton(text="Я"),
+        ],
+    ],
+    resize_keyboard=True,
+)
+
+_MAIN_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📚 Узнать ДЗ"), KeyboardButton(text="➕ Добавить ДЗ")],
+        [KeyboardButton(text="👥 Мой класс"), KeyboardButton(text="👤 Профиль")],
+        [KeyboardButton(text="🏆 Топ учеников")],
+    ],
+    resize_keyboard=True,
+)
+
+_SKIP_PHOTO_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Пропустить фото")],
+        [KeyboardButton(text="❌ Отмена")],
+    ],
+    resize_keyboard=True,
+)
+
+_ANON_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="Анонимно"), KeyboardButton(text="От своего имени")]],
+    resize_keyboard=True,
+)
+
+_FINISH_CONTENT_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Готово ✅")],
+        [KeyboardButton(text="❌ Отмена")],
+    ],
+    resize_keyboard=True,
+)
+
+_CANCEL_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="❌ Отмена")]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+_SETTINGS_CHANGE_KB = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="📝 Изменить класс",
+                callback_data=ChangeCallback(kind="grade").pack(),
+            ),
+            InlineKeyboardButton(
+                text="📝 Изменить имя",
+                callback_data=ChangeCallback(kind="name").pack(),
+            ),
+        ]
+    ]
+)
+
+_TOP_PERIOD_KB = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="📅 За неделю", callback_data=TopCallback(period="week").pack()
+            ),
+            InlineKeyboardButton(
+                text="🗓 За месяц", callback_data=TopCallback(period="month").pack()
+            ),
+        ]
+    ]
+)
+
+# Схемы сериализации pydantic в aiogram строятся лениво (defer_build):
+# пробная сериализация при импорте снимает эту работу с первых ответов
+for _kb in (
+    _CONFIRM_KB,
+    _GRADE_KB,
+    _LETTER_KB,
+    _MAIN_MENU_KB,
+    _SKIP_PHOTO_KB,
+    _ANON_KB,
+    _FINISH_CONTENT_KB,
+    _CANCEL_KB,
+    _SETTINGS_CHANGE_KB,
+    _TOP_PERIOD_KB,
+):
+    _kb.model_dump(warnings=False)
+del _kb
 
 
 def get_confirm_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="✅ Да, верно"), KeyboardButton(text="❌ Нет")]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    return _CONFIRM_KB
 
 
 def get_grade_kb():
-    kb = ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="8"),
-                KeyboardButton(text="9"),
-                KeyboardButton(text="10"),
-                KeyboardButton(text="11"),
-            ]
-        ],
-        resize_keyboard=True,
-    )
-    return kb
+    return _GRADE_KB
 
 
 def get_letter_kb():
-    kb = ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="Т"),
-                KeyboardButton(text="М"),
-                KeyboardButton(text="Э"),
-            ],
-            [
-                KeyboardButton(text="А"),
-                KeyboardButton(text="Я"),
-            ],
-        ],
-        resize_keyboard=True,
-    )
-    return kb
+    return _LETTER_KB
 
 
 def get_main_menu_kb():
-    kb = [
-        [KeyboardButton(text="📚 Узнать ДЗ"), KeyboardButton(text="➕ Добавить ДЗ")],
-        [KeyboardButton(text="👥 Мой класс"), KeyboardButton(text="👤 Профиль")],
-        [KeyboardButton(text="🏆 Топ учеников")],
-    ]
-    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+    return _MAIN_MENU_KB
 
 
 def get_subjects_kb(subjects):
+    return _build_subjects_kb(tuple(subject["name"] for subject in subjects))
+
+
+# Каталог предметов почти не меняется: клавиатура строится один раз на набор названий
+@lru_cache(maxsize=4)
+def _build_subjects_kb(names):
     builder = ReplyKeyboardBuilder()
-    for subject in subjects:
-        builder.add(KeyboardButton(text=subject["name"]))
+    for name in names:
+        builder.add(KeyboardButton(text=name))
     builder.adjust(2)
     return builder.as_markup(resize_keyboard=True)
 
 
 def get_skip_photo_kb():
-    kb = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Пропустить фото")],
-            [KeyboardButton(text="❌ Отмена")],
-        ],
-        resize_keyboard=True,
-    )
+    return _SKIP_PHOTO_KB
 
 
 def get_anon_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Анонимно"), KeyboardButton(text="От своего имени")]
-        ],
-        resize_keyboard=True,
-    )
+    return _ANON_KB
 
 
+# --- Клавиатуры с параметрами: кэш по аргументам ---
+# Карточку задания или решения видит весь класс, и у всех кнопки одинаковые.
+# Объекты из lru_cache тоже общие, менять их нельзя
+@lru_cache(maxsize=1024)
 def get_hw_actions_kb(hw_id, has_solution=False):
     buttons = [
         [
             InlineKeyboardButton(
-                text="➕ Добавить решение", callback_data=f"solve_{hw_id}"
+                text="➕ Добавить решение",
+                callback_data=SolveCallback(hw_id=hw_id).pack(),
             )
         ]
     ]
@@ -93,14 +192,16 @@ def get_hw_actions_kb(hw_id, has_solution=False):
         buttons.append(
             [
                 InlineKeyboardButton(
-                    text="📖 Посмотреть решения", callback_data=f"view_{hw_id}"
+                    text="📖 Посмотреть решения",
+                    callback_data=ViewCallback(hw_id=hw_id).pack(),
                 )
             ]
         )
     buttons.append(
         [
             InlineKeyboardButton(
-                text="🚩 Пожаловаться", callback_data=f"report_hw_{hw_id}"
+                text="🚩 Пожаловаться",
+                callback_data=ReportCallback(kind="hw", target_id=hw_id).pack(),
             )
         ]
     )
@@ -108,40 +209,55 @@ def get_hw_actions_kb(hw_id, has_solution=False):
 
 
 def get_date_selection_kb():
-    today = datetime.now()
+    return _build_date_kb(datetime.now().date())
+
+
+# Кнопки зависят только от сегодняшней даты: одна клавиатура на день
+@lru_cache(maxsize=2)
+def _build_date_kb(today):
     tomorrow = today + timedelta(days=1)
     after_tomorrow = today + timedelta(days=2)
 
     kb = [
         [
             InlineKeyboardButton(
-                text="На завтра", callback_data=f"date_{tomorrow.strftime("%Y-%m-%d")}"
+                text="На завтра",
+                callback_data=DateCallback(day=tomorrow.strftime("%Y-%m-%d")).pack(),
             ),
             InlineKeyboardButton(
                 text="На послезавтра",
-                callback_data=f"date_{after_tomorrow.strftime("%Y-%m-%d")}",
+                callback_data=DateCallback(
+                    day=after_tomorrow.strftime("%Y-%m-%d")
+                ).pack(),
             ),
         ],
         [
             InlineKeyboardButton(
-                text="Другой день (внести вручную)", callback_data="date_manual"
+                text="Другой день (внести вручную)",
+                callback_data=DateCallback(day="manual").pack(),
             )
         ],
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
+@lru_cache(maxsize=1024)
 def get_solution_votes_kb(sol_id, ups=0, downs=0):
     kb = [
         [
-            InlineKeyboardButton(text=f"👍 {ups}", callback_data=f"vote_up_{sol_id}"),
             InlineKeyboardButton(
-                text=f"👎 {downs}", callback_data=f"vote_down_{sol_id}"
+                text=f"👍 {ups}",
+                callback_data=VoteCallback(action="up", sol_id=sol_id).pack(),
+            ),
+            InlineKeyboardButton(
+                text=f"👎 {downs}",
+                callback_data=VoteCallback(action="down", sol_id=sol_id).pack(),
             ),
         ],
         [
             InlineKeyboardButton(
-                text="🚩 Пожаловаться", callback_data=f"report_sol_{sol_id}"
+                text="🚩 Пожаловаться",
+                callback_data=ReportCallback(kind="sol", target_id=sol_id).pack(),
             )
         ],
     ]
@@ -149,33 +265,47 @@ def get_solution_votes_kb(sol_id, ups=0, downs=0):
 
 
 def get_finish_content_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Готово ✅")],
-            [KeyboardButton(text="❌ Отмена")],
-        ],
-        resize_keyboard=True,
-    )
+    return _FINISH_CONTENT_KB
 
 
 def get_cancel_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="❌ Отмена")]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    return _CANCEL_KB
 
 
 def get_settings_change_kb():
+    return _SETTINGS_CHANGE_KB
+
+
+def get_top_period_kb():
+    return _TOP_PERIOD_KB
+
+
+# Кнопка следующей страницы: в callback_data ключ последней показанной строки
+def get_more_homework_kb(target_date, hw_id):
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
-                    text="📝 Изменить класс", callback_data="change_grade"
-                ),
+                    text="Показать еще ➡️",
+                    callback_data=HomeworkPageCallback(
+                        target_date=target_date, hw_id=hw_id
+                    ).pack(),
+                )
+            ]
+        ]
+    )
+
+
+def get_more_solutions_kb(hw_id, score, sol_id):
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
                 InlineKeyboardButton(
-                    text="📝 Изменить имя", callback_data="change_name"
-                ),
+                    text="Еще решения ➡️",
+                    callback_data=SolutionPageCallback(
+                        hw_id=hw_id, score=score, sol_id=sol_id
+                    ).pack(),
+                )
             ]
         ]
     )
@@ -0,0 +1,90 @@
+from typing import Any, Dict, List, Optional, Tuple
+from sortedcontainers import SortedList
+
+FIELDS = ("user_id", "first_name", "last_name", "grade", "letter", "reputation")
+
+
+# --- Рейтинг учеников в памяти: общий и по классам ---
+# Ключ (-репутация, user_id): первыми идут ученики с наибольшей репутацией.
+# Вставка, удаление и поиск места стоят O(log n)
+class Leaderboard:
+    def __init__(self):
+        self.loaded = False
+        self._users: Dict[int, Dict[str, Any]] = {}
+        self._global = SortedList()
+        self._classes: Dict[Tuple[Any, Any], SortedList] = {}
+
+    @staticmethod
+    def _key(user) -> Tuple[int, int]:
+        return (-user["reputation"], user["user_id"])
+
+    @staticmethod
+    def _class_of(user) -> Tuple[Any, Any]:
+        return (user["grade"], user["letter"])
+
+    def _insert(self, user):
+        self._users[user["user_id"]] = user
+        self._global.add(self._key(user))
+        self._classes.setdefault(self._class_of(user), SortedList()).add(self._key(user))
+
+    def _remove(self, user_id) -> Optional[Dict[str, Any]]:
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return None
+
+        self._global.remove(self._key(user))
+        members = self._classes[self._class_of(user)]
+        members.remove(self._key(user))
+        if not members:
+            del self._classes[self._class_of(user)]
+        return user
+
+    def load(self, users):
+        self._users.clear()
+        self._global.clear()
+        self._classes.clear()
+        for user in users:
+            self._insert({field: user[field] for field in FIELDS})
+        self.loaded = True
+
+    def upsert(self, user):
+        self._remove(user["user_id"])
+        self._insert({field: user[field] for field in FIELDS})
+
+    def update(self, user_id, **changes):
+        user = self._remove(user_id)
+        if user is None:
+            return
+        user.update(changes)
+        self._insert(user)
+
+    def add_reputation(self, user_id, delta):
+        user = self._users.get(user_id)
+        if user is not None:
+            self.update(user_id, reputation=user["reputation"] + delta)
+
+    def _rows(self, keys) -> List[Dict[str, Any]]:
+        return [dict(self._users[user_id]) for _, user_id in keys]
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return self._rows(self._global.islice(0, limit))
+
+    def class_top(self, grade, letter, limit: Optional[int] = None):
+        members = self._classes.get((grade, letter))
+        if not members:
+            return []
+        return self._rows(members.islice(0, limit))
+
+    # Место считается как в спорте: одинаковая репутация - одинаковое место
+    def rank(self, user_id) -> Optional[Tuple[int, int]]:
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        return self._global.bisect_left((-user["reputation"],)) + 1, len(self._global)
+
+    def class_rank(self, user_id) -> Optional[Tuple[int, int]]:
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        members = self._classes[self._class_of(user)]
+        return members.bisect_left((-user["reputation"],)) + 1, len(members)
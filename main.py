@@ -2,33 +2,99 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
+from cards import cache_stats as card_cache_stats
 from database import Database
 from handlers import router as user_router
+from middlewares import (
+    AccessMiddleware,
+    AlbumMiddleware,
+    UnitOfWorkMiddleware,
+    UserContextMiddleware,
+)
+from sender import Sender
+from storage import SQLiteStorage
+from tasks import (
+    compact_reputation_loop,
+    expire_fsm_loop,
+    expire_homework_loop,
+    sweep_orphans_loop,
+)
 
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+EXPIRY_INTERVAL_MINUTES = float(os.getenv("EXPIRY_INTERVAL_MINUTES", "60"))
+SWEEP_INTERVAL_HOURS = float(os.getenv("SWEEP_INTERVAL_HOURS", "24"))
+SWEEP_VACUUM = os.getenv("SWEEP_VACUUM", "0") == "1"
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+FSM_STATE_TTL_HOURS = float(os.getenv("FSM_STATE_TTL_HOURS", "168"))
 
 if TOKEN is None:
     raise ValueError("Токен TELEGRAM_BOT_TOKEN не найден в переменных окружения.")
 
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
-db = Database("school_hub.db")
+db = Database("school_hub.db", write_behind=DB_WRITE_BEHIND)
+storage = SQLiteStorage(db, ttl=FSM_STATE_TTL_HOURS * 3600)
+dp = Dispatcher(storage=storage)
+sender = Sender(bot)
 
 
 async def main():
-    await db.create_tables()
-    await db.seed_subjects()
-    await bot.delete_webhook(drop_pending_updates=True)
+    logging.basicConfig(level=logging.INFO)
+    await db.connect()
+    background = []
+    try:
+        await db.create_tables()
+        await db.seed_subjects()
+        await db.load_leaderboard()
+        await db.load_access()
 
-    dp.include_router(user_router)
+        mismatches = await db.check_vote_counters(fix=True)
+        if mismatches:
+            logging.warning("Исправлены счетчики голосов у %s решений", len(mismatches))
+        await storage.start()
+        await bot.delete_webhook(drop_pending_updates=True)
+        await sender.start()
 
-    print("Бот запущен и база готова!")
-    await dp.start_polling(bot, db=db)
+        background.append(
+            asyncio.create_task(expire_homework_loop(db, EXPIRY_INTERVAL_MINUTES * 60))
+        )
+        background.append(
+            asyncio.create_task(
+                sweep_orphans_loop(db, SWEEP_INTERVAL_HOURS * 3600, vacuum=SWEEP_VACUUM)
+            )
+        )
+        background.append(asyncio.create_task(compact_reputation_loop(db, 24 * 3600)))
+        background.append(asyncio.create_task(expire_fsm_loop(storage, 3600)))
+
+        dp.update.middleware(UnitOfWorkMiddleware())
+        # Пользователь грузится до фильтров, права проверяются по флагам маршрута
+        for observer in (dp.message, dp.callback_query):
+            observer.outer_middleware(UserContextMiddleware())
+            observer.middleware(AccessMiddleware())
+        # Фото одного альбома обработчик получает одним вызовом
+        dp.message.middleware(AlbumMiddleware())
+        dp.include_router(user_router)
+
+        print("Бот запущен и база готова!")
+        await dp.start_polling(bot, db=db, sender=sender)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await sender.close()
+        # Несохраненные состояния FSM пишутся до закрытия базы
+        await storage.close()
+        logging.info("Статистика отправки: %s", sender.stats())
+        logging.info("Статистика FSM: %s", storage.stats())
+        logging.info(
+            "Статистика кэшей: %s", {**db.cache_stats(), "cards": card_cache_stats()}
+        )
+        await db.close()
 
 
 if __name__ == "__main__":
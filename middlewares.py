@@ -0,0 +1,134 @@
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from database import Database
+
+
+# --- Одна транзакция на апдейт: все записи обработчика фиксируются вместе ---
+class UnitOfWorkMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        db: Database = data["db"]
+        async with db.unit_of_work() as uow_db:
+            data["db"] = uow_db
+            return await handler(event, data)
+
+
+# --- Пользователь апдейта: загружается один раз и передается обработчику ---
+class UserContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        db: Database = data["db"]
+        data["user"] = await db.get_user(from_user.id) if from_user else None
+        return await handler(event, data)
+
+
+# --- Права на маршрут: @router.message(..., flags={"access": ACTIVE}) ---
+# Баны и админы проверяются по множествам в памяти, без запросов к базе
+REGISTERED = "registered"
+ACTIVE = "active"
+ADMIN = "admin"
+
+# Ответ на отказ: (для сообщения, для нажатия кнопки)
+REJECTIONS = {
+    REGISTERED: (
+        "<b>Упс!</b> Похоже, ты еще не зарегистрирован.\nДля регистрации напиши /start",
+        "❌ Сначала зарегистрируйтесь в боте!",
+    ),
+    ACTIVE: (
+        "⛔ Вы заблокированы администрацией.",
+        "⛔ Вы забанены из-за нарушений. Вы в режиме 'Только чтение'",
+    ),
+    ADMIN: ("❌ У вас нет прав админа.", "❌ У вас нет прав админа."),
+}
+
+
+# Возвращает True, если доступ есть; иначе сам отвечает пользователю отказом
+async def check_access(access: str, event: TelegramObject, data: Dict[str, Any]) -> bool:
+    db: Database = data["db"]
+    from_user = data.get("event_from_user")
+    user_id = from_user.id if from_user else None
+
+    if access == ADMIN and not db.is_admin(user_id):
+        denied = ADMIN
+    elif access == ACTIVE and db.is_banned(user_id):
+        denied = ACTIVE
+    elif data.get("user") is None:
+        denied = REGISTERED
+    else:
+        return True
+
+    message_text, alert_text = REJECTIONS[denied]
+    if isinstance(event, CallbackQuery):
+        await event.answer(alert_text, show_alert=True)
+    elif isinstance(event, Message):
+        await event.answer(message_text)
+    return False
+
+
+class AccessMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        access = get_flag(data, "access")
+        if access is None or await check_access(access, event, data):
+            return await handler(event, data)
+
+
+# --- Альбомы: каждое фото media_group приходит отдельным апдейтом ---
+# Для маршрута с flags={"album": True} первый апдейт группы ждет, пока
+# части перестанут приходить latency секунд, и вызывает обработчик один
+# раз с album - всеми сообщениями группы по порядку. Остальные апдейты
+# отдают свое сообщение первому и на этом заканчиваются
+class AlbumMiddleware(BaseMiddleware):
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self._albums: Dict[Tuple[int, str], List[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if (
+            not isinstance(event, Message)
+            or not event.media_group_id
+            or not get_flag(data, "album")
+        ):
+            return await handler(event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return None
+
+        album = self._albums[key] = [event]
+        try:
+            seen = 0
+            while seen != len(album):
+                seen = len(album)
+                await asyncio.sleep(self.latency)
+        finally:
+            del self._albums[key]
+
+        album.sort(key=lambda message: message.message_id)
+        data["album"] = album
+        return await handler(event, data)
@@ -0,0 +1,280 @@
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+import asyncio
+import itertools
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: ответы пользователю обгоняют массовые рассылки
+INTERACTIVE = 0
+BULK = 1
+
+
+# --- Корзина токенов: rate отправок в секунду, всплеск до burst подряд ---
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        self._refill()
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1):
+        self._refill()
+        self.tokens -= min(cost, self.burst)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class _Item:
+    __slots__ = ("method", "priority", "future", "attempts", "cost")
+
+    def __init__(self, method: TelegramMethod, priority: int, future: asyncio.Future):
+        self.method = method
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        # В общем лимите бота альбом идет как столько сообщений, сколько в нем
+        # фото; в лимите чата это один запрос, как и любое другое сообщение
+        media = getattr(method, "media", None)
+        self.cost = len(media) if isinstance(media, list) else 1
+
+
+class _Chat:
+    __slots__ = ("queue", "bucket", "scheduled", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.queue: Deque[_Item] = deque()
+        self.bucket = bucket
+        # Чат стоит в очереди готовых не больше одного раза: так его
+        # сообщения уходят по одному и строго по порядку
+        self.scheduled = False
+        self.paused_until = 0.0
+
+
+# --- Планировщик исходящих сообщений ---
+# Обработчики отдают сюда готовые методы (message.answer(...), SendMessage(...)),
+# а несколько воркеров отправляют их с учетом лимитов Telegram: общего
+# на бота и отдельного на каждый чат. В пределах чата порядок сохраняется.
+# Всплеск чата (chat_burst) покрывает целую страницу: 5 заданий и кнопку
+# (6 запросов) или 3 решения с альбомами и кнопку (7), поэтому первая
+# страница уходит сразу. Хуже всего - страница сразу после предыдущей:
+# в корзине остался один токен, она пополняется по chat_rate, и последнее
+# из 7 сообщений ждет около 6 с
+class Sender:
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = 25.0,
+        global_burst: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 8.0,
+        workers: int = 8,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[Hashable, _Chat] = {}
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._queued = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.metrics = {
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "retry_after": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout: float = 10.0):
+        # Даем досылать то, что уже в очереди, потом останавливаем воркеров
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не отправлено сообщений при остановке: %s", self._queued)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for chat in self._chats.values():
+            for item in chat.queue:
+                if not item.future.done():
+                    item.future.cancel()
+        self._chats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queued,
+            "chats": sum(1 for chat in self._chats.values() if chat.queue),
+            **self.metrics,
+        }
+
+    def submit(self, method: TelegramMethod, priority: int = INTERACTIVE) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        chat_id = getattr(method, "chat_id", None)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+
+        chat.queue.append(_Item(method, priority, future))
+        self._queued += 1
+        self._idle.clear()
+        if not chat.scheduled:
+            self._schedule(chat_id, chat)
+        return future
+
+    async def send(self, method: TelegramMethod, priority: int = INTERACTIVE) -> Any:
+        return await self.submit(method, priority)
+
+    # Отправляет методы окном по window штук: следующий ставится в очередь,
+    # как только ушел самый ранний. Порядок внутри чата держит очередь чата.
+    # Ошибки возвращаются на месте результата, остальные сообщения уходят
+    async def send_many(
+        self, methods: Iterable[TelegramMethod], priority: int = INTERACTIVE, window: int = 10
+    ) -> List[Any]:
+        futures = []
+        in_flight: Deque[asyncio.Future] = deque()
+        for method in methods:
+            if len(in_flight) >= window:
+                await asyncio.wait([in_flight.popleft()])
+            future = self.submit(method, priority)
+            futures.append(future)
+            in_flight.append(future)
+
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    def _schedule(self, chat_id, chat: _Chat, delay: float = 0.0):
+        chat.scheduled = True
+        entry: Tuple[int, int, Hashable] = (chat.queue[0].priority, next(self._order), chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, entry)
+        else:
+            self._ready.put_nowait(entry)
+
+    # Возвращает True, если чат остается за текущим воркером
+    def _done(self, chat_id, chat: _Chat) -> bool:
+        self._queued -= 1
+        if not self._queued:
+            self._idle.set()
+
+        if chat.queue:
+            # Никто не ждет очереди - воркер сразу шлет следующее сообщение
+            # этого чата, без круга через очередь готовых
+            if self._ready.empty():
+                return True
+            self._schedule(chat_id, chat)
+            return False
+
+        chat.scheduled = False
+        # Полная корзина ничем не отличается от новой, такой чат можно забыть
+        if chat.bucket.full and chat.paused_until <= time.monotonic():
+            del self._chats[chat_id]
+        return False
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._ready.get()
+            while await self._serve(chat_id, self._chats[chat_id]):
+                pass
+
+    async def _serve(self, chat_id, chat: _Chat) -> bool:
+        item = chat.queue[0]
+        if item.future.cancelled():
+            # Тот, кто ждал отправки, уже отменен: лимит на него не тратим
+            chat.queue.popleft()
+            return self._done(chat_id, chat)
+
+        # Чату пока нельзя писать: возвращаем его позже, воркер не простаивает
+        delay = max(chat.bucket.wait_time(), chat.paused_until - time.monotonic())
+        if delay > 0:
+            self.metrics["throttled_seconds"] += delay
+            self._schedule(chat_id, chat, delay)
+            return False
+
+        delay = self._global.wait_time(item.cost)
+        while delay > 0:
+            self.metrics["throttled_seconds"] += delay
+            await asyncio.sleep(delay)
+            delay = self._global.wait_time(item.cost)
+
+        chat.bucket.take()
+        self._global.take(item.cost)
+        retry_in = await self._send(chat, item)
+        if retry_in is not None:
+            self._schedule(chat_id, chat, retry_in)
+            return False
+
+        chat.queue.popleft()
+        return self._done(chat_id, chat)
+
+    # Возвращает паузу перед повтором или None, если с сообщением покончено
+    async def _send(self, chat: _Chat, item: _Item) -> Optional[float]:
+        try:
+            result = await self.bot(item.method)
+        except TelegramRetryAfter as e:
+            # Telegram сам говорит, сколько ждать: пауза только для этого чата
+            self.metrics["retry_after"] += 1
+            chat.paused_until = time.monotonic() + e.retry_after
+            logger.warning(
+                "Флуд-лимит для чата %s: пауза %s с",
+                getattr(item.method, "chat_id", None),
+                e.retry_after,
+            )
+            return e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            item.attempts += 1
+            if item.attempts <= self.max_retries:
+                self.metrics["retries"] += 1
+                return self.backoff * 2 ** (item.attempts - 1)
+            self._fail(item, e)
+        except Exception as e:
+            self._fail(item, e)
+        else:
+            self.metrics["sent"] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        return None
+
+    def _fail(self, item: _Item, error: Exception):
+        self.metrics["failed"] += 1
+        if not item.future.done():
+            item.future.set_exception(error)
+        # Исключение уже у того, кто ждет; если никто не ждет - хотя бы в логе
+        item.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        logger.warning("Не удалось отправить %s: %s", type(item.method).__name__, error)
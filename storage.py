@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(
+        self,
+        state: Optional[str] = None,
+        data: Optional[Dict[str, Any]] = None,
+        updated_at: float = 0.0,
+    ):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+# --- Хранилище FSM в school_hub.db ---
+# Горячие записи лежат в памяти в LRU на hot_size ключей, включая пустые:
+# FSM спрашивает состояние на каждом апдейте, и у большинства его нет.
+# Изменения пишутся в базу пачкой раз в flush_interval: несколько
+# update_data подряд дают одну запись. Измененная запись не вытесняется из
+# памяти, пока не сохранена. Состояния старше ttl считаются брошенными
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        db: Database,
+        hot_size: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        flush_interval: float = 0.5,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.db = db
+        self.hot_size = hot_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._hot: "OrderedDict[str, _Record]" = OrderedDict()
+        self._dirty: Dict[str, _Record] = {}
+        # Пачка, которую сейчас пишет flush: ее записи могли уже вытесниться
+        # из _hot, а в базе еще старая строка
+        self._flushing: Dict[str, _Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_wanted = asyncio.Event()
+        self._flusher_task: Optional[asyncio.Task] = None
+        self.metrics = {"hits": 0, "loads": 0, "flushes": 0, "written": 0, "expired": 0}
+
+    async def start(self):
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.create_task(self._flusher_loop())
+
+    # Вызывается и диспетчером при остановке, и main: второй вызов ничего не делает
+    async def close(self):
+        if self._flusher_task is not None:
+            # Под блокировкой: не прерываем сброс, который уже пишет пачку
+            async with self._flush_lock:
+                self._flusher_task.cancel()
+                await asyncio.gather(self._flusher_task, return_exceptions=True)
+            self._flusher_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hot": len(self._hot), "dirty": len(self._dirty), **self.metrics}
+
+    def _expired(self, record: _Record) -> bool:
+        return not record.empty and record.updated_at < time.time() - self.ttl
+
+    def _remember(self, name: str, record: _Record):
+        self._hot[name] = record
+        self._hot.move_to_end(name)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _cached(self, name: str) -> Optional[_Record]:
+        return self._dirty.get(name) or self._flushing.get(name) or self._hot.get(name)
+
+    async def _record(self, name: str) -> _Record:
+        record = self._cached(name)
+        if record is not None:
+            self.metrics["hits"] += 1
+        else:
+            self.metrics["loads"] += 1
+            row = await self.db.get_fsm_state(name)
+            # Пока шел запрос, запись мог загрузить или изменить другой апдейт
+            record = self._cached(name)
+            if record is None:
+                record = _Record()
+                if row:
+                    record = _Record(row["state"], json.loads(row["data"]), row["updated_at"])
+
+        if self._expired(record):
+            self.metrics["expired"] += 1
+            record = _Record()
+            self._changed(name, record)
+        self._remember(name, record)
+        return record
+
+    def _changed(self, name: str, record: _Record):
+        record.updated_at = time.time()
+        self._dirty[name] = record
+        self._flush_wanted.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = self.key_builder.build(key)
+        record = await self._record(name)
+        record.state = state.state if isinstance(state, State) else state
+        self._changed(name, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        name = self.key_builder.build(key)
+        record = await self._record(name)
+        record.data = data.copy()
+        self._changed(name, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(self.key_builder.build(key))).data.copy()
+
+    # Без лишнего круга get_data/set_data: данные меняются на месте
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        name = self.key_builder.build(key)
+        record = await self._record(name)
+        record.data.update(data)
+        self._changed(name, record)
+        return record.data.copy()
+
+    async def _flusher_loop(self):
+        while True:
+            await self._flush_wanted.wait()
+            # Копим изменения за интервал, чтобы записать их одной транзакцией
+            await asyncio.sleep(self.flush_interval)
+            self._flush_wanted.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить состояния FSM")
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush_batch()
+
+    async def _flush_batch(self):
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        self._flushing = dirty
+        rows = [
+            (
+                name,
+                record.state,
+                json.dumps(record.data, ensure_ascii=False),
+                record.updated_at,
+            )
+            for name, record in dirty.items()
+        ]
+        try:
+            await self.db.save_fsm_states(rows)
+        except Exception:
+            # Не потерять изменения: вернуть их, если ключ с тех пор не менялся
+            for name, record in dirty.items():
+                self._dirty.setdefault(name, record)
+            self._flush_wanted.set()
+            raise
+        finally:
+            self._flushing = {}
+
+        self.metrics["flushes"] += 1
+        self.metrics["written"] += len(rows)
+
+    async def delete_expired(self) -> int:
+        return await self.db.delete_stale_fsm_states(time.time() - self.ttl)
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import time
+
+from database import Database
+from storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_next_run(interval: float, now: datetime = None) -> float:
+    # Ближайший из двух моментов: через interval секунд или сразу после полуночи
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    after_midnight = (midnight - now).total_seconds() + 5
+    return max(0.0, min(interval, after_midnight))
+
+
+# --- Фоновая очистка просроченных заданий ---
+async def expire_homework_loop(db: Database, interval: float, batch_size: int = 500):
+    while True:
+        try:
+            started = time.perf_counter()
+            removed = await db.delete_expired_homework(batch_size=batch_size)
+            logger.info(
+                "Очистка ДЗ: удалено заданий %s, всего строк %s за %.3f с",
+                removed["homework"],
+                removed["rows"],
+                time.perf_counter() - started,
+            )
+        except Exception:
+            logger.exception("Ошибка при удалении просроченных заданий")
+
+        await asyncio.sleep(seconds_until_next_run(interval))
+
+
+# --- Фоновая очистка осиротевших решений, голосов, медиа и жалоб ---
+async def sweep_orphans_loop(
+    db: Database, interval: float, vacuum: bool = False, batch_size: int = 500
+):
+    while True:
+        try:
+            started = time.perf_counter()
+            result = await db.sweep_orphans(batch_size=batch_size, vacuum=vacuum)
+            logger.info(
+                "Очистка сирот: удалено %s, освобождено %s КБ, файл меньше на %s КБ за %.3f с",
+                result["removed"],
+                result["freed_bytes"] // 1024,
+                result["shrunk_bytes"] // 1024,
+                time.perf_counter() - started,
+            )
+        except Exception:
+            logger.exception("Ошибка при очистке осиротевших строк")
+
+        await asyncio.sleep(interval)
+
+
+# --- Сворачивание старых корзин репутации ---
+async def compact_reputation_loop(db: Database, interval: float, keep_days: int = 35):
+    while True:
+        try:
+            started = time.perf_counter()
+            folded = await db.compact_reputation(keep_days=keep_days)
+            logger.info(
+                "Сжатие репутации: свернуто дневных корзин %s за %.3f с",
+                folded,
+                time.perf_counter() - started,
+            )
+        except Exception:
+            logger.exception("Ошибка при сжатии корзин репутации")
+
+        await asyncio.sleep(interval)
+
+
+# --- Удаление брошенных диалогов FSM ---
+async def expire_fsm_loop(storage: SQLiteStorage, interval: float):
+    while True:
+        try:
+            started = time.perf_counter()
+            removed = await storage.delete_expired()
+            logger.info(
+                "Очистка FSM: удалено состояний %s за %.3f с, хранилище %s",
+                removed,
+                time.perf_counter() - started,
+                storage.stats(),
+            )
+        except Exception:
+            logger.exception("Ошибка при удалении старых состояний FSM")
+
+        await asyncio.sleep(interval)
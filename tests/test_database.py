@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+# Задание или решение удалили, пока пользователь отвечал: запись не падает
+# на внешнем ключе, а сообщает, что цели больше нет
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_missing_parent(tmp_path, write_behind):
+    async def run():
+        db = Database(str(tmp_path / "school_hub.db"), write_behind=write_behind)
+        try:
+            await db.create_tables()
+            await db.seed_subjects()
+            for user_id in (1, 2):
+                await db.register_user(user_id, "Имя", "Фамилия", 9, "А")
+            await db.add_homework(1, 9, "А", "Задача", None, "2099-01-01", 1, 0)
+            hw_id = (await db.get_homework_feed(9, "А"))[0]["id"]
+            sol_id = await db.add_solution(hw_id, 1, "Решение", 0)
+
+            assert await db.add_solution(hw_id + 100, 2, "Решение", 0) is None
+            assert await db.add_vote(2, sol_id + 100, 1) is None
+
+            assert await db.add_vote(2, sol_id, 1) is True
+            assert await db.add_vote(2, sol_id, -1) is False
+            await db.flush()
+            assert await db.get_solution_votes(sol_id) == (1, 0)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import MIGRATIONS, Database
+
+# Запросы, которые бот выполняет на каждое нажатие: лента класса, решения
+# с фото, голоса, медиа и рейтинг, плюс фоновая очистка просроченных
+# заданий. load_leaderboard читает users целиком один раз при старте,
+# поэтому сюда не входит
+HOT_QUERIES = {
+    "feed": lambda db, ids: db.get_homework_feed(9, "А"),
+    "homework by class": lambda db, ids: db.get_homework_by_class(9, "А", after=("2099-01-01", 0)),
+    "homework": lambda db, ids: db.get_homework_by_id(ids["hw"]),
+    "solutions": lambda db, ids: db.get_solutions_bundle(ids["hw"], limit=5),
+    "solutions page": lambda db, ids: db.get_solutions(ids["hw"], after=(0, ids["sol"]), limit=5),
+    "solution exists": lambda db, ids: db.check_solution_exists(ids["hw"]),
+    "solution": lambda db, ids: db.get_solution_by_id(ids["sol"]),
+    "vote": lambda db, ids: db.add_vote(3, ids["sol"], 1),
+    "votes": lambda db, ids: db.get_solution_votes(ids["sol"]),
+    "media": lambda db, ids: db.get_media(ids["sol"], "solution"),
+    "user": lambda db, ids: db.get_user(2),
+    "ranking": lambda db, ids: db.get_top_users_for_period(7),
+    "fsm": lambda db, ids: db.get_fsm_state("fsm:1:1:1:default"),
+    "expiry": lambda db, ids: db.delete_expired_homework(),
+}
+
+SKIPPED = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+
+async def fill(db: Database):
+    await db.create_tables()
+    await db.seed_subjects()
+    for user_id in (1, 2, 3):
+        await db.register_user(user_id, "Имя", "Фамилия", 9, "А")
+    await db.add_homework(1, 9, "А", "Задача", None, "2099-01-01", 1, 0)
+    hw = (await db.get_homework_feed(9, "А"))[0]["id"]
+    sol = await db.add_solution(hw, 2, "Решение", 0)
+    await db.add_solution_media_many(sol, ["photo_1", "photo_2"])
+    await db.add_vote(1, sol, 1)
+    return {"hw": hw, "sol": sol}
+
+
+# SQL, который метод Database реально отправил в SQLite, с подставленными
+# параметрами: план проверяется у того же текста, что выполняет бот
+async def trace(db: Database, name: str, ids) -> list:
+    statements = []
+    for conn in db._connections:
+        await conn.set_trace_callback(statements.append)
+    try:
+        await HOT_QUERIES[name](db, ids)
+    finally:
+        for conn in db._connections:
+            await conn.set_trace_callback(None)
+    return [sql for sql in statements if not sql.lstrip().upper().startswith(SKIPPED)]
+
+
+def full_scans(conn: sqlite3.Connection, sql: str) -> list:
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    # SCAN без индекса - полный проход по таблице; поиск по индексу - SEARCH
+    return [
+        row[3]
+        for row in plan
+        if row[3].startswith("SCAN ") and " INDEX " not in row[3] and "CONSTANT ROW" not in row[3]
+    ]
+
+
+@pytest.fixture(scope="module")
+def traced(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "school_hub.db")
+
+    async def run():
+        db = Database(path)
+        ids = await fill(db)
+        try:
+            return {name: await trace(db, name, ids) for name in HOT_QUERIES}
+        finally:
+            await db.close()
+
+    return path, asyncio.run(run())
+
+
+def test_migrations_applied(traced):
+    path, _ = traced
+    with sqlite3.connect(path) as conn:
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    assert version == MIGRATIONS[-1][0]
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_index(traced, name):
+    path, statements = traced
+    assert statements[name], f"{name}: запрос не дошел до SQLite"
+
+    conn = sqlite3.connect(path)
+    try:
+        for sql in statements[name]:
+            assert not full_scans(conn, sql), f"{name}: полный проход\n{sql}"
+    finally:
+        conn.close()
+
+
+# Очистка медиа и жалоб идет триггерами на каждое удаленное задание и
+# решение; EXPLAIN QUERY PLAN не заходит внутрь триггера, поэтому его
+# запросы проверяются по отдельности
+def trigger_statements(path) -> list:
+    with sqlite3.connect(path) as conn:
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+        statements = []
+        for name, sql in triggers.fetchall():
+            body = sql[sql.upper().index("BEGIN") + len("BEGIN") : sql.upper().rindex("END")]
+            statements += [
+                (name, statement.strip().replace("OLD.id", "1"))
+                for statement in body.split(";")
+                if statement.strip()
+            ]
+    return statements
+
+
+def test_cleanup_triggers_use_index(traced):
+    path, _ = traced
+    statements = trigger_statements(path)
+    assert statements
+
+    conn = sqlite3.connect(path)
+    try:
+        for name, sql in statements:
+            assert not full_scans(conn, sql), f"{name}: полный проход\n{sql}"
+    finally:
+        conn.close()
+
+
+# Проверка не должна проходить впустую: чтение всей таблицы она замечает
+def test_full_scan_detected(traced):
+    path, _ = traced
+    conn = sqlite3.connect(path)
+    try:
+        assert full_scans(conn, "SELECT * FROM votes WHERE vote_value = 1")
+    finally:
+        conn.close()
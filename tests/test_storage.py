@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database import Database
+from storage import SQLiteStorage
+
+
+def key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+# Запись вытеснили из памяти, пока ее пачка пишется в базу: чтение берет
+# ее из пачки, а не старую строку из базы, и следующее изменение не теряется
+async def check(db: Database):
+    storage = SQLiteStorage(db, hot_size=1)
+    try:
+        await storage.set_data(key(1), {"step": 1})
+        await storage.flush()
+        await storage.update_data(key(1), {"step": 2})
+
+        release = asyncio.Event()
+        save = db.save_fsm_states
+
+        async def slow_save(rows):
+            await release.wait()
+            await save(rows)
+
+        db.save_fsm_states = slow_save
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0)
+        try:
+            # Другой пользователь вытесняет запись из горячего слоя
+            await storage.get_state(key(2))
+            assert await storage.get_data(key(1)) == {"step": 2}
+            await storage.update_data(key(1), {"photos": ["p"]})
+        finally:
+            release.set()
+            await flush
+            db.save_fsm_states = save
+        await storage.flush()
+    finally:
+        await storage.close()
+
+    restarted = SQLiteStorage(db)
+    assert await restarted.get_data(key(1)) == {"step": 2, "photos": ["p"]}
+    await restarted.close()
+
+
+def test_evicted_during_flush(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "school_hub.db"))
+        try:
+            await db.create_tables()
+            await check(db)
+        finally:
+            await db.close()
+
+    asyncio.run(run())
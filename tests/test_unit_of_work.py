@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+class Boom(Exception):
+    pass
+
+
+async def open_db(path, **kwargs) -> Database:
+    db = Database(path, **kwargs)
+    await db.create_tables()
+    await db.seed_subjects()
+    for user_id in (1, 2):
+        await db.register_user(user_id, "Имя", "Фамилия", 9, "А")
+    return db
+
+
+# Строка, прочитанная через незафиксированную транзакцию, не попадает в кэш
+def test_rolled_back_user_not_cached(tmp_path):
+    async def run():
+        db = await open_db(str(tmp_path / "school_hub.db"))
+        try:
+            assert (await db.get_user(1))["grade"] == 9
+
+            with pytest.raises(Boom):
+                async with db.unit_of_work():
+                    await db.update_user_grade(1, 11, "Б")
+                    assert (await db.get_user(1))["grade"] == 11
+                    raise Boom()
+
+            assert (await db.get_user(1))["grade"] == 9
+            row = await db._execute("SELECT grade FROM users WHERE user_id = 1", fetchone=True)
+            assert row["grade"] == 9
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+# Публикация решения и голос откатываются целиком и в режиме отложенной
+# записи: голос и баллы не должны дойти до базы при следующем сбросе
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_rollback_discards_reputation_and_votes(tmp_path, write_behind):
+    async def run():
+        db = await open_db(str(tmp_path / "school_hub.db"), write_behind=write_behind)
+        try:
+            await db.add_homework(1, 9, "А", "Задача", None, "2099-01-01", 1, 0)
+            hw_id = (await db.get_homework_feed(9, "А"))[0]["id"]
+            sol_id = await db.add_solution(hw_id, 1, "Решение", 0)
+
+            with pytest.raises(Boom):
+                async with db.unit_of_work():
+                    await db.add_solution(hw_id, 2, "Второе решение", 0)
+                    await db.update_reputation(2, 5, reason="solution")
+                    raise Boom()
+
+            with pytest.raises(Boom):
+                async with db.unit_of_work():
+                    assert await db.add_vote(2, sol_id, 1)
+                    raise Boom()
+
+            await db.flush()
+            solutions = await db._execute("SELECT id FROM solutions", fetch=True)
+            assert [row["id"] for row in solutions] == [sol_id]
+            assert (await db.get_user(1))["reputation"] == 0
+            assert (await db.get_user(2))["reputation"] == 0
+            assert await db.get_solution_votes(sol_id) == (0, 0)
+
+            # Зафиксированный апдейт доходит до базы в обоих режимах
+            async with db.unit_of_work():
+                await db.update_reputation(2, 5, reason="solution")
+                assert await db.add_vote(2, sol_id, 1)
+            await db.flush()
+            assert (await db.get_user(2))["reputation"] == 5
+            assert (await db.get_user(1))["reputation"] == 1
+            assert await db.get_solution_votes(sol_id) == (1, 0)
+        finally:
+            await db.close()
+
+    asyncio.run(run())